@@ -0,0 +1,35 @@
+"""Idle keep-alive connections benchmark
+
+Open many idle connections to a running server, and report server CPU
+time per second while they're idle, eg:
+
+    python benchmark/idle.py --port 8080 --pid <server pid> --connections 5000
+"""
+import time
+import socket
+import argparse
+
+from keepalive import cpu_time
+
+
+def main(args):
+    conns = []
+    for __ in range(args.connections):
+        conns.append(socket.create_connection((args.host, args.port)))
+    time.sleep(1)
+    begin_cpu = cpu_time(args.pid)
+    time.sleep(args.duration)
+    cpu = (cpu_time(args.pid) - begin_cpu) / args.duration
+    print(f'{len(conns)} idle connections, server CPU time {cpu * 1000:.1f}ms per second')
+    for sock in conns:
+        sock.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--pid', type=int, required=True, help='server pid')
+    parser.add_argument('--connections', type=int, default=1000)
+    parser.add_argument('--duration', type=float, default=10)
+    main(parser.parse_args())
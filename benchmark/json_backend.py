@@ -0,0 +1,38 @@
+"""JSON backends benchmark, dumps to bytes and loads from bytes
+
+    python benchmark/json_backend.py --number 1000
+
+Backends not installed are skipped.
+"""
+import argparse
+
+from weirb.jsoncodec import JSON_BACKENDS, load_json_codec
+
+from json_encoder import PAYLOADS, bench
+
+
+def load_codecs():
+    codecs = []
+    for name in JSON_BACKENDS:
+        try:
+            codecs.append((name, load_json_codec(name)))
+        except ImportError:
+            print(f'{name} not installed, skipped')
+    return codecs
+
+
+def main(args):
+    codecs = load_codecs()
+    for payload_name, __, value in PAYLOADS:
+        print(f'{payload_name}:')
+        content = codecs[0][1].dumps(value)
+        for name, codec in codecs:
+            dumps = bench(codec.dumps, value, args.number)
+            loads = bench(codec.loads, content, args.number)
+            print(f'{name:>10}: dumps {dumps:.1f}us, loads {loads:.1f}us')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--number', type=int, default=1000)
+    main(parser.parse_args())
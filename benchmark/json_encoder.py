@@ -0,0 +1,112 @@
+"""JSON encoder benchmark, precompiled encoder vs json and ujson
+
+The json codec is the stdlib backend, which creates the C encoder once.
+
+    python benchmark/json_encoder.py --number 1000
+
+All encoders output utf-8 bytes, include the cost of str.encode.
+"""
+import json
+import time
+import argparse
+
+from validr import T
+
+from weirb.encoder import compile_json_encoder
+from weirb.jsoncodec import StdlibJsonCodec
+
+try:
+    import ujson
+except ModuleNotFoundError:
+    ujson = None
+
+
+User = T.dict(
+    id=T.int,
+    name=T.str,
+    email=T.email,
+    score=T.float,
+    is_active=T.bool,
+    tags=T.list(T.str),
+    created_at=T.datetime,
+)
+
+Order = T.dict(
+    id=T.int,
+    user=User,
+    items=T.list(T.dict(
+        product=T.str,
+        price=T.float,
+        quantity=T.int,
+    )),
+    note=T.str.optional,
+    metadata=T.any,
+)
+
+
+def make_user(i):
+    return dict(
+        id=i,
+        name=f'用户{i}',
+        email=f'user{i}@example.com',
+        score=i * 1.5,
+        is_active=i % 2 == 0,
+        tags=['vip', 'beta'],
+        created_at='2019-01-01T00:00:00.000000Z',
+    )
+
+
+def make_order(i):
+    return dict(
+        id=i,
+        user=make_user(i),
+        items=[dict(product=f'product-{k}', price=9.9, quantity=k) for k in range(3)],
+        note='',
+        metadata={'source': 'web', 'ip': '127.0.0.1'},
+    )
+
+
+PAYLOADS = [
+    ('user', User, make_user(1)),
+    ('users x100', T.list(User), [make_user(i) for i in range(100)]),
+    ('orders x100', T.list(Order), [make_order(i) for i in range(100)]),
+]
+
+
+def json_dumps(value):
+    return json.dumps(value, ensure_ascii=False).encode('utf-8')
+
+
+def ujson_dumps(value):
+    return ujson.dumps(value, ensure_ascii=False).encode('utf-8')
+
+
+def bench(encode, value, number, repeat=5):
+    """Best of repeat, in microseconds"""
+    costs = []
+    for _ in range(repeat):
+        begin = time.perf_counter()
+        for _ in range(number):
+            encode(value)
+        costs.append(time.perf_counter() - begin)
+    return min(costs) / number * 10**6
+
+
+def main(args):
+    for name, schema, value in PAYLOADS:
+        encoder = compile_json_encoder(T(schema).__schema__)
+        assert encoder(value) == json_dumps(value)
+        result = [f'{name:>12}:']
+        result.append(f'precompiled {bench(encoder, value, args.number):.1f}us')
+        result.append(f'json {bench(json_dumps, value, args.number):.1f}us')
+        codec_dumps = StdlibJsonCodec().dumps
+        result.append(f'json codec {bench(codec_dumps, value, args.number):.1f}us')
+        if ujson is not None:
+            result.append(f'ujson {bench(ujson_dumps, value, args.number):.1f}us')
+        print(' '.join(result))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--number', type=int, default=1000)
+    main(parser.parse_args())
@@ -0,0 +1,42 @@
+"""Peak memory of encoding large list at once vs incrementally
+
+    python benchmark/json_incremental.py --size 100000
+"""
+import argparse
+import tracemalloc
+
+from weirb.jsoncodec import StdlibJsonCodec, iter_encode_list
+
+
+def peak_memory(fn, *args):
+    tracemalloc.start()
+    try:
+        fn(*args)
+        __, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak
+
+
+def encode_at_once(codec, items):
+    codec.dumps(items)
+
+
+def encode_incremental(codec, items):
+    for chunk in iter_encode_list(items, codec.dumps):
+        pass
+
+
+def main(args):
+    codec = StdlibJsonCodec()
+    items = [dict(id=i, name=f'user{i}', email=f'user{i}@example.com', score=i / 3)
+             for i in range(args.size)]
+    for name, fn in [('at once', encode_at_once), ('incremental', encode_incremental)]:
+        peak = peak_memory(fn, codec, items)
+        print(f'{name:>12}: peak {peak / 1024 / 1024:.2f}MB')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--size', type=int, default=100000)
+    main(parser.parse_args())
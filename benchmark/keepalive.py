@@ -0,0 +1,91 @@
+"""Keep-alive HTTP benchmark
+
+Start a server first, eg: `weirb serve --name hello --port 8080`, then:
+
+    python benchmark/keepalive.py --port 8080 --path /hello/say
+
+When client and server share CPUs, requests/sec is bounded by the client,
+pass `--pid <server pid>` to also report server CPU time per request.
+Latency is measured per request from writing the request to reading
+the whole response, run with `--connections 1` for unloaded latency.
+"""
+import os
+import time
+import asyncio
+import argparse
+
+
+def build_request(host, port, path):
+    body = b'{}'
+    return (
+        f'POST {path} HTTP/1.1\r\n'
+        f'Host: {host}:{port}\r\n'
+        f'Content-Type: application/json\r\n'
+        f'Content-Length: {len(body)}\r\n'
+        f'\r\n'
+    ).encode() + body
+
+
+async def read_response(reader):
+    headers = await reader.readuntil(b'\r\n\r\n')
+    length = 0
+    for line in headers.split(b'\r\n'):
+        name, __, value = line.partition(b':')
+        if name.strip().lower() == b'content-length':
+            length = int(value)
+    await reader.readexactly(length)
+
+
+async def connection(host, port, request, deadline, latencies):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        while True:
+            begin = time.monotonic()
+            if begin >= deadline:
+                break
+            writer.write(request)
+            await read_response(reader)
+            latencies.append(time.monotonic() - begin)
+    finally:
+        writer.close()
+
+
+def cpu_time(pid):
+    with open(f'/proc/{pid}/stat') as f:
+        fields = f.read().rsplit(')', 1)[1].split()
+    utime, stime = int(fields[11]), int(fields[12])
+    return (utime + stime) / os.sysconf('SC_CLK_TCK')
+
+
+async def main(args):
+    request = build_request(args.host, args.port, args.path)
+    latencies = []
+    if args.pid:
+        begin_cpu = cpu_time(args.pid)
+    begin = time.monotonic()
+    deadline = begin + args.duration
+    await asyncio.gather(*[
+        connection(args.host, args.port, request, deadline, latencies)
+        for __ in range(args.connections)
+    ])
+    cost = time.monotonic() - begin
+    total = len(latencies)
+    print(f'{total} requests in {cost:.2f}s, {total / cost:.0f} requests/sec')
+    latencies.sort()
+    p50 = latencies[total // 2] * 10**6
+    p99 = latencies[total * 99 // 100] * 10**6
+    print(f'latency p50 {p50:.0f}us, p99 {p99:.0f}us')
+    if args.pid:
+        cpu = (cpu_time(args.pid) - begin_cpu) / total
+        print(f'server CPU time {cpu * 10**6:.1f}us per request')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--path', default='/hello/say')
+    parser.add_argument('--connections', type=int, default=50)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--pid', type=int, help='server pid')
+    asyncio.get_event_loop().run_until_complete(main(parser.parse_args()))
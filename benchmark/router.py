@@ -0,0 +1,96 @@
+"""Router benchmark, compiled radix tree router vs werkzeug Map matching
+
+    python benchmark/router.py --routes 10 1000 10000
+
+Route cache is bypassed, every lookup is a cache miss.
+"""
+import time
+import random
+import argparse
+
+from werkzeug.routing import Map, Rule
+
+from weirb.router import Router
+
+
+class Handler:
+    def __init__(self, path, methods, is_method=False):
+        self.routes = [Route(path, methods)]
+        self.is_method = is_method
+
+
+class Route:
+    def __init__(self, path, methods):
+        self.path = path
+        self.methods = methods
+
+
+class Service:
+    def __init__(self, handlers):
+        self.handlers = handlers
+
+
+class WerkzeugRouter:
+    """The werkzeug Map based router, for comparison"""
+
+    def __init__(self, services, server_name):
+        self.server_name = server_name
+        self.url_map = Map([
+            Rule(route.path, methods=route.methods, endpoint=handler)
+            for service in services
+            for handler in service.handlers
+            for route in handler.routes
+        ])
+
+    def lookup(self, path, method):
+        url = self.url_map.bind(server_name=self.server_name)
+        return url.match(path_info=path, method=method)
+
+
+def build_routes(num_routes):
+    """RPC methods, and REST views with parameters"""
+    handlers = []
+    paths = []
+    for i in range(num_routes):
+        kind = i % 4
+        if kind == 0:
+            handlers.append(Handler(f'/user{i}/<int:id>', ['GET']))
+            paths.append(('GET', f'/user{i}/{i}'))
+        elif kind == 1:
+            handlers.append(Handler(f'/file{i}/<path:path>', ['GET']))
+            paths.append(('GET', f'/file{i}/a/b/c.txt'))
+        else:
+            handlers.append(Handler(f'/service{i}/method{i}', ['POST'], is_method=True))
+            paths.append(('POST', f'/service{i}/method{i}'))
+    return [Service(handlers)], paths
+
+
+def bench(lookup, paths, number):
+    begin = time.perf_counter()
+    for method, path in paths[:number]:
+        lookup(path, method)
+    cost = time.perf_counter() - begin
+    return cost / min(number, len(paths)) * 10**6
+
+
+def main(args):
+    for num_routes in args.routes:
+        services, paths = build_routes(num_routes)
+        paths = paths * (args.number // len(paths) + 1)
+        random.shuffle(paths)
+        begin = time.perf_counter()
+        router = Router(services, 'localhost')
+        compile_cost = time.perf_counter() - begin
+        # bypass the route cache
+        radix = bench(router._lookup, paths, args.number)
+        werkzeug_router = WerkzeugRouter(services, 'localhost')
+        werkzeug = bench(werkzeug_router.lookup, paths, args.number)
+        print(f'{num_routes:>6} routes: radix {radix:.1f}us, werkzeug {werkzeug:.1f}us '
+              f'per lookup, compile {compile_cost * 1000:.1f}ms')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--routes', type=int, nargs='+', default=[10, 1000, 10000])
+    parser.add_argument('--number', type=int, default=2000)
+    main(parser.parse_args())
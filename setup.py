@@ -32,6 +32,7 @@ setup(
         'mako>=1.0',
     ],
     extras_require={
+        'msgpack': ['msgpack>=0.6'],
         'dev': [
             'invoke==1.0.0',
             'pytest==3.6.1',
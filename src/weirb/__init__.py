@@ -4,7 +4,19 @@ from .client import Client
 from .request import RawRequest, Request
 from .response import AbstractResponse, Response
 from .scope import require, Scope
-from .service import raises, route
+from .service import (
+    raises,
+    route,
+    max_body_size,
+    max_timeout,
+    validate_returns,
+    cached,
+    get_cache,
+    single_flight,
+    get_single_flight,
+    concurrency_limit,
+    offload,
+)
 
 __version__ = find_version()
 __all__ = (
@@ -14,6 +26,15 @@ __all__ = (
     "require",
     "raises",
     "route",
+    "max_body_size",
+    "max_timeout",
+    "validate_returns",
+    "cached",
+    "get_cache",
+    "single_flight",
+    "get_single_flight",
+    "concurrency_limit",
+    "offload",
     "RawRequest",
     "Request",
     "AbstractResponse",
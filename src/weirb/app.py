@@ -17,7 +17,10 @@ from .error import BUILTIN_SERVICE_ERRORS
 from .context import Context
 from .helper import import_all_classes, shorten_text, concat_words, is_terminal
 from .config import InternalConfig, INTERNAL_VALIDATORS
-from .service import Service
+from .service import Service, BatchHandler
+from .jsoncodec import load_json_codec
+from .msgpackcodec import MsgpackCodec
+from .offload import OffloadPool
 from .router import Router
 from .scope import Scope
 from .compat.contextlib import asynccontextmanager
@@ -35,10 +38,26 @@ class App:
         self._load_config_class()
         self._load_config(cli_config)
         config_logging(self.import_name, self.config)
+        self._load_json_codec()
+        self._load_msgpack_codec()
         self._scopes = {}
         self._active_plugins()
+        self._load_offload_pools()
         self._load_services()
-        self.router = Router(self.services, self.config.server_name)
+        self.max_content_length = self._get_max_content_length()
+        # the running server, set by serve()
+        self.server = None
+        self.batch_handler = None
+        extra_handlers = []
+        if self.config.batch_enable:
+            self.batch_handler = BatchHandler(self, self.services)
+            extra_handlers.append(self.batch_handler)
+        self.router = Router(
+            self.services,
+            self.config.server_name,
+            extra_handlers=extra_handlers,
+            negative_cache_size=self.config.router_negative_cache_size,
+        )
         self._print_info()
 
     def __repr__(self):
@@ -128,6 +147,23 @@ class App:
         for k, v in asdict(self.config).items():
             self._config_dict[f"config.{k}"] = v
 
+    def _load_json_codec(self):
+        backend = self.config.json_backend
+        try:
+            self.json_codec = load_json_codec(backend)
+        except (ImportError, TypeError) as ex:
+            msg = f"failed to load json backend {backend!r}: {ex}"
+            raise ConfigError(msg) from None
+
+    def _load_msgpack_codec(self):
+        self.msgpack_codec = None
+        if self.config.msgpack_enable:
+            try:
+                self.msgpack_codec = MsgpackCodec()
+            except ImportError:
+                msg = "msgpack_enable is set but msgpack not installed!"
+                raise ConfigError(msg) from None
+
     def _active_plugins(self):
         self.contexts = []
         self.decorators = []
@@ -160,6 +196,23 @@ class App:
                 msg = f"the requires {missing} of plugin {plugin} is missing"
                 raise DependencyError(msg)
 
+    def _load_offload_pools(self):
+        config = self.config
+        process_workers = config.offload_process_workers or os.cpu_count()
+        workers = dict(thread=config.offload_thread_workers, process=process_workers)
+        self.offload_pools = {}
+        for kind, max_workers in workers.items():
+            self.offload_pools[kind] = OffloadPool(
+                kind,
+                max_workers,
+                max_queue=config.offload_max_queue,
+                queue_timeout=config.offload_queue_timeout,
+            )
+
+    def offload_info(self):
+        """Queue depth and execution time of offload pools, by kind"""
+        return {kind: pool.info() for kind, pool in self.offload_pools.items()}
+
     def _load_services(self):
         import_name = self.config.service_import_name
         if not import_name:
@@ -172,6 +225,35 @@ class App:
             if s.handlers:
                 self.services.append(s)
 
+    def _get_max_content_length(self):
+        """Max Content-Length accepted before dispatch, the largest of
+        request_max_body_size and overrides of handlers, None if unlimited"""
+        limit = self.config.request_max_body_size
+        for service in self.services:
+            for handler in service.handlers:
+                if "max_body_size" not in handler.tags:
+                    continue
+                if handler.max_body_size is None:
+                    return None
+                limit = max(limit, handler.max_body_size)
+        return limit
+
+    def admission_info(self):
+        """Occupancy of connections and requests of the server in this
+        process, None if the app is not serving"""
+        if self.server is None:
+            return None
+        return self.server.admission.occupancy
+
+    def bulkhead_info(self):
+        """In-flight and queued counts of concurrency limits, by name"""
+        info = {}
+        for service in self.services:
+            for handler in service.handlers:
+                for bulkhead in handler.bulkheads:
+                    info[bulkhead.name] = bulkhead.info()
+        return info
+
     def context(self):
         return Context(self)
 
@@ -0,0 +1,114 @@
+from collections import deque
+
+from newio import timeout_after
+from newio.sync import Event
+
+from .error import ServiceUnavailable
+
+
+class _Waiter:
+    __slots__ = ('event', 'granted')
+
+    def __init__(self):
+        self.event = Event()
+        self.granted = False
+
+
+class Bulkhead:
+    """Concurrency limit with bounded FIFO wait queue
+
+    Calls exceeding max_concurrency wait in the queue, when the queue is
+    full or waited more than queue_timeout seconds, ServiceUnavailable is
+    raised immediately instead of waiting.
+
+    Usage:
+
+        async with bulkhead:
+            ...
+
+    Args:
+        name: name for error message and metrics
+        max_concurrency: max number of concurrent calls
+        max_queue: max number of waiting calls, 0 means no waiting
+        queue_timeout: max seconds to wait, None means no timeout
+    """
+
+    def __init__(self, name, max_concurrency, max_queue=0, queue_timeout=None):
+        if max_concurrency <= 0:
+            raise ValueError('max_concurrency should be > 0')
+        if max_queue < 0:
+            raise ValueError('max_queue should be >= 0')
+        if queue_timeout is not None and queue_timeout < 0:
+            raise ValueError('queue_timeout should be None or >= 0')
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self._waiters = deque()
+        self.rejected = 0
+        self.timeouts = 0
+
+    def __repr__(self):
+        return (f'<{type(self).__name__} {self.name} in_flight={self.in_flight} '
+                f'queued={self.queued}>')
+
+    @property
+    def queued(self):
+        return len(self._waiters)
+
+    def _overloaded(self, reason):
+        return ServiceUnavailable(f'{self.name} is overloaded, {reason}')
+
+    async def acquire(self):
+        if self.in_flight < self.max_concurrency and not self._waiters:
+            self.in_flight += 1
+            return
+        if len(self._waiters) >= self.max_queue:
+            self.rejected += 1
+            raise self._overloaded('wait queue is full')
+        waiter = _Waiter()
+        self._waiters.append(waiter)
+        try:
+            if self.queue_timeout is None:
+                await waiter.event.wait()
+            else:
+                async with timeout_after(self.queue_timeout):
+                    await waiter.event.wait()
+        except BaseException:
+            # the slot is handed over but the call is cancelled, pass it on
+            if waiter.granted:
+                await self.release()
+            else:
+                self._waiters.remove(waiter)
+            raise
+        if not waiter.granted:
+            self._waiters.remove(waiter)
+            self.timeouts += 1
+            raise self._overloaded('wait queue timeout')
+
+    async def release(self):
+        if self._waiters:
+            # hand over the slot to the first waiter, in_flight unchanged
+            waiter = self._waiters.popleft()
+            waiter.granted = True
+            await waiter.event.set()
+        else:
+            self.in_flight -= 1
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.release()
+
+    def info(self):
+        return dict(
+            in_flight=self.in_flight,
+            queued=self.queued,
+            max_concurrency=self.max_concurrency,
+            max_queue=self.max_queue,
+            rejected=self.rejected,
+            timeouts=self.timeouts,
+        )
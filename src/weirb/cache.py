@@ -0,0 +1,209 @@
+import json
+import time
+from collections import OrderedDict
+
+from newio.sync import Event
+from validr import Invalid
+
+from .error import ServiceInvalidParams
+
+
+def _make_key(params):
+    return json.dumps(params, sort_keys=True, ensure_ascii=False, default=str)
+
+
+class ResultCache:
+    """Result cache of a RPC method, with TTL and LRU eviction
+
+    Cached values are keyed on validated params, the cache is shared by
+    all apps of the method. Use `invalidate(**params)` or `clear()` to
+    remove results explicitly, eg: from handlers which update the data.
+
+    A result may be cached in many variants, eg: serialized by different
+    wire formats, variants of the same params expire and are removed
+    together.
+
+    Args:
+        ttl: time to live in seconds, None means never expire
+        maxsize: max number of cached results
+    """
+
+    def __init__(self, ttl=None, maxsize=1024):
+        if ttl is not None and ttl <= 0:
+            raise ValueError('ttl should be None or > 0')
+        if maxsize <= 0:
+            raise ValueError('maxsize should be > 0')
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._params_validator = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def __repr__(self):
+        return f'<{type(self).__name__} ttl={self.ttl} maxsize={self.maxsize}>'
+
+    def __len__(self):
+        return len(self._data)
+
+    def __deepcopy__(self, memo):
+        # the cache is shared state, not copied with handler tags
+        return self
+
+    def bind(self, params_validator):
+        """Bind params validator of the method, used by invalidate"""
+        self._params_validator = params_validator
+
+    def _get_variants(self, key):
+        """Variants of the key, None if not cached or expired"""
+        item = self._data.get(key)
+        if item is None:
+            return None
+        variants, expires = item
+        if expires is not None and expires <= time.monotonic():
+            del self._data[key]
+            self.expirations += 1
+            return None
+        return variants
+
+    def get(self, params, variant=None):
+        key = _make_key(params)
+        variants = self._get_variants(key)
+        value = None
+        if variants is not None:
+            value = variants.get(variant)
+        if value is None:
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, params, value, variant=None):
+        key = _make_key(params)
+        variants = self._get_variants(key)
+        if variants is not None:
+            variants[variant] = value
+        else:
+            expires = None
+            if self.ttl is not None:
+                expires = time.monotonic() + self.ttl
+            self._data[key] = ({variant: value}, expires)
+        self._data.move_to_end(key)
+        if len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, **params):
+        """Remove cached result of the params, returns True if removed
+
+        Params are validated by the method's params schema, so default
+        values are filled as same as calling the method.
+        """
+        if self._params_validator is not None:
+            try:
+                params = self._params_validator(params)
+            except Invalid as ex:
+                raise ServiceInvalidParams(str(ex)) from None
+        removed = self._data.pop(_make_key(params), None) is not None
+        if removed:
+            self.invalidations += 1
+        return removed
+
+    def clear(self):
+        self._data.clear()
+
+    def info(self):
+        return dict(
+            hits=self.hits,
+            misses=self.misses,
+            evictions=self.evictions,
+            expirations=self.expirations,
+            invalidations=self.invalidations,
+            size=len(self._data),
+            maxsize=self.maxsize,
+        )
+
+
+class _Flight:
+    __slots__ = ('done', 'result', 'error', 'cancelled')
+
+    def __init__(self):
+        self.done = Event()
+        self.result = None
+        self.error = None
+        self.cancelled = False
+
+
+class SingleFlight:
+    """Coalesce concurrent calls of a RPC method with equal params
+
+    Only the first call executes, the others wait for it and get the
+    same result or error. Shared by all apps of the method.
+    """
+
+    def __init__(self):
+        self._flights = {}
+        self.calls = 0
+        self.executions = 0
+
+    def __repr__(self):
+        return f'<{type(self).__name__} in_flight={len(self._flights)}>'
+
+    def __deepcopy__(self, memo):
+        # in-flight state is shared, not copied with handler tags
+        return self
+
+    @property
+    def coalesced(self):
+        return self.calls - self.executions
+
+    @property
+    def coalescing_ratio(self):
+        """Ratio of calls which shared execution of another call"""
+        if not self.calls:
+            return 0.0
+        return self.coalesced / self.calls
+
+    async def call(self, params, fn, *args, variant=None):
+        """Call fn(*args), or wait for the in-flight call with equal params
+        and variant"""
+        key = (variant, _make_key(params))
+        self.calls += 1
+        while True:
+            flight = self._flights.get(key)
+            if flight is None:
+                break
+            await flight.done.wait()
+            # the executing call is cancelled, retry
+            if flight.cancelled:
+                continue
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+        flight = self._flights[key] = _Flight()
+        self.executions += 1
+        try:
+            flight.result = await fn(*args)
+        except Exception as ex:
+            flight.error = ex
+            raise
+        except BaseException:
+            flight.cancelled = True
+            raise
+        finally:
+            del self._flights[key]
+            await flight.done.set()
+        return flight.result
+
+    def info(self):
+        return dict(
+            calls=self.calls,
+            executions=self.executions,
+            coalesced=self.coalesced,
+            coalescing_ratio=self.coalescing_ratio,
+            in_flight=len(self._flights),
+        )
@@ -1,6 +1,7 @@
-import json
 import inspect
 import logging
+import pprint
+import weakref
 import concurrent.futures
 from urllib.parse import urlencode
 from threading import Thread
@@ -15,10 +16,20 @@ from .helper import shorten_text, stream
 from .request import RawRequest
 from .error import HttpError, InternalServerError
 from .response import ErrorResponse
+from .compat.contextlib import AsyncExitStack
+from .jsoncodec import StdlibJsonCodec
+from .msgpackcodec import MsgpackCodec, MSGPACK_MIMETYPE, MSGPACK_MIMETYPES
+
+NDJSON_MIMETYPE = "application/x-ndjson"
 
 LOG = logging.getLogger(__name__)
 
 
+def _is_ndjson(response):
+    content_type = Headers(response.headers).get("Content-Type", "")
+    return parse_options_header(content_type)[0].lower() == NDJSON_MIMETYPE
+
+
 def _format_headers(headers):
     headers = [f"{k}: {v}" for k, v in headers.items()]
     return "\n".join(headers)
@@ -56,14 +67,68 @@ class ClientRequest(RawRequest):
         )
 
 
+class ClientStreamingBody:
+    """Iterator of chunks of streaming response body
+
+    Chunks are pulled from the server thread on demand, the request
+    context is exited when the body is finished or closed.
+    """
+
+    def __init__(self, call, body, stack):
+        self._call = call
+        self._body = body.__aiter__()
+        self._stack = stack
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._stack is None:
+            raise StopIteration
+        try:
+            return self._call(self._body.__anext__())
+        except StopAsyncIteration:
+            self.close()
+            raise StopIteration from None
+        except BaseException:
+            self.close()
+            raise
+
+    async def _aclose(self, stack):
+        async with stack:
+            aclose = getattr(self._body, "aclose", None)
+            if aclose is not None:
+                await aclose()
+
+    def close(self):
+        if self._stack is None:
+            return
+        stack, self._stack = self._stack, None
+        self._call(self._aclose(stack))
+
+
 class ClientResponse:
-    def __init__(self, status, status_text, headers, content):
+    """Response of test client
+
+    Args:
+        content: bytes, or ClientStreamingBody of streaming response which
+            is consumed by either `stream` or `content`
+    """
+
+    def __init__(self, status, status_text, headers, content, json_codec=None):
         self.status = status
         self.status_text = status_text
         self.headers = ClientHeaders(headers or {})
-        self.content = content
+        self._body = content
+        self.json_codec = json_codec or StdlibJsonCodec()
         self.__repr_text = self.__repr()
 
+    @cached_property
+    def content(self):
+        if isinstance(self._body, bytes):
+            return self._body
+        return b"".join(self._body)
+
     @cached_property
     def ok(self):
         return 200 <= self.status <= 399
@@ -106,6 +171,42 @@ class ClientResponse:
             return True
         return False
 
+    @cached_property
+    def is_msgpack(self):
+        return self.mimetype in MSGPACK_MIMETYPES
+
+    @cached_property
+    def is_ndjson(self):
+        return self.mimetype == NDJSON_MIMETYPE
+
+    @property
+    def stream(self):
+        """Iterator of items of streaming response, the last item is an
+        error entry if the stream is broken, eg: {"error": ..., "message": ...}
+        """
+        if not self.is_ndjson:
+            msg = (
+                'The response is not streaming, or missing NDJSON '
+                'content-type header, eg: application/x-ndjson'
+            )
+            raise ValueError(msg)
+        return self.__iter_stream()
+
+    def __iter_stream(self):
+        if isinstance(self._body, bytes) or "content" in self.__dict__:
+            chunks = [self.content]
+        else:
+            chunks = self._body
+        buffer = b""
+        for chunk in chunks:
+            lines = (buffer + chunk).split(b"\n")
+            buffer = lines.pop()
+            for line in lines:
+                if line.strip():
+                    yield self.json_codec.loads(line)
+        if buffer.strip():
+            yield self.json_codec.loads(buffer)
+
     @cached_property
     def cookies(self):
         """A :class:`dict` with the contents of all cookies transmitted with
@@ -130,7 +231,17 @@ class ClientResponse:
                 'content-type header, eg: application/json'
             )
             raise ValueError(msg)
-        return json.loads(self.text)
+        return self.json_codec.loads(self.content)
+
+    @cached_property
+    def msgpack(self):
+        if not self.is_msgpack:
+            msg = (
+                'The response has no MessagePack data, or missing '
+                'content-type header, eg: application/msgpack'
+            )
+            raise ValueError(msg)
+        return MsgpackCodec().loads(self.content)
 
     def __repr(self):
         status_line = f"{self.status} {self.status_text}"
@@ -138,10 +249,17 @@ class ClientResponse:
         if self.is_json:
             try:
                 data = self.json
-            except (json.JSONDecodeError, UnicodeDecodeError) as ex:
+            except ValueError as ex:
                 text = f"Failed to decode JSON content: {ex}"
             else:
-                text = json.dumps(data, ensure_ascii=False, indent=4)
+                text = self.json_codec.dumps(data, indent=4).decode("utf-8")
+        elif self.is_msgpack:
+            try:
+                text = pprint.pformat(self.msgpack)
+            except (ValueError, ImportError) as ex:
+                text = f"Failed to decode MessagePack content: {ex}"
+        elif not isinstance(self._body, bytes):
+            text = ""
         else:
             try:
                 text = self.text
@@ -175,6 +293,7 @@ class Client:
         self.headers = ClientHeaders(headers or {})
         self.request_channel = Channel()
         self.server = self.__start_server(self.request_channel)
+        self.__streams = weakref.WeakSet()
 
     async def __request(self, path, *, method, query=None, body=None, headers=None):
         path = "/" + path.lstrip("/")
@@ -185,7 +304,8 @@ class Client:
         raw_request = ClientRequest(
             path, method=method, query=query, body=body, headers=request_headers
         )
-        async with self.app.context() as ctx:
+        async with AsyncExitStack() as stack:
+            ctx = await stack.enter_async_context(self.app.context())
             try:
                 response = await ctx(raw_request)
             except HttpError as ex:
@@ -193,7 +313,13 @@ class Client:
             except Exception as ex:
                 LOG.error("Error raised when handle request:", exc_info=ex)
                 response = ErrorResponse(InternalServerError(str(ex)))
-            return await self.__read_response(response)
+            if not _is_ndjson(response):
+                return await self.__read_response(response)
+            # keep the context until the streaming body finished
+            stack = stack.pop_all()
+        content = ClientStreamingBody(self.__call_in_server, response.body, stack)
+        self.__streams.add(content)
+        return self.__create_response(response, content)
 
     def __request_body(self, body):
         if body is None:
@@ -204,9 +330,15 @@ class Client:
         content = []
         async for chunk in response.body:
             content.append(chunk)
-        content = b"".join(content)
+        return self.__create_response(response, b"".join(content))
+
+    def __create_response(self, response, content):
         return ClientResponse(
-            response.status, response.status_text, response.headers, content
+            response.status,
+            response.status_text,
+            response.headers,
+            content,
+            json_codec=self.app.json_codec,
         )
 
     async def __server_main(self, request_channel):
@@ -226,16 +358,21 @@ class Client:
         return server
 
     def close(self):
+        for content in list(self.__streams):
+            content.close()
         self.request_channel.controller.close()
         self.server.join()
 
+    def __call_in_server(self, coro):
+        fut = concurrent.futures.Future()
+        self.request_channel.sync.send((coro, fut))
+        return fut.result()
+
     def request(self, path, *, method, query=None, body=None, headers=None):
         coro = self.__request(
             path, method=method, query=query, body=body, headers=headers
         )
-        fut = concurrent.futures.Future()
-        self.request_channel.sync.send((coro, fut))
-        return fut.result()
+        return self.__call_in_server(coro)
 
     def __data_request(self, path, *, method, query=None, data=None, headers=None):
         if headers:
@@ -273,6 +410,14 @@ class Client:
         return self.request(path, method="OPTIONS", query=query, headers=headers)
 
     def call(self, path, **params):
+        """Call RPC method, items of streaming method are iterated by
+        `response.stream` while the body is being read"""
         headers = {"Content-Type": "application/json;charset=utf-8"}
-        text = json.dumps(params, ensure_ascii=False, indent=4)
-        return self.request(path, method="POST", body=text, headers=headers)
+        body = self.app.json_codec.dumps(params, indent=4)
+        return self.request(path, method="POST", body=body, headers=headers)
+
+    def call_msgpack(self, path, **params):
+        """Call RPC method with MessagePack request and response"""
+        headers = {"Content-Type": MSGPACK_MIMETYPE, "Accept": MSGPACK_MIMETYPE}
+        body = MsgpackCodec().dumps(params)
+        return self.request(path, method="POST", body=body, headers=headers)
@@ -1,6 +1,5 @@
 from validr import T, Invalid, validator
 
-from .error import ConfigError
 
 _LOG_LEVELS = {"DEBUG", "INFO", "WARN", "WARNING", "ERROR", "CRITICAL"}
 
@@ -38,7 +37,33 @@ class InternalConfig:
     root_path = T.str.optional
     server_name = T.str.optional
     backlog = T.int.min(1).default(1024)
+    workers = T.int.min(1).default(1)
     xheaders = T.bool.default(False)
+    # admission control, set 0 to disable the limits
+    max_connections = T.int.min(0).default(0)
+    max_requests = T.int.min(0).default(0)
+    overload_retry_after = T.int.min(0).default(1)
+    accept_batch_size = T.int.min(1).default(16)
+    # cache of route errors, eg: not found, set 0 to disable the cache
+    router_negative_cache_size = T.int.min(0).default(1024)
+
+    # concurrency limit of each service, 0 means unlimited, calls exceed
+    # the limit wait in a queue, overridden by concurrency_limit tag
+    service_max_concurrency = T.int.min(0).default(0)
+    service_max_queue = T.int.min(0).default(0)
+    service_queue_timeout = T.float.min(0).optional
+
+    # bounded pools of offload handlers, calls exceed the workers wait
+    # in the queue, process workers default to number of CPUs
+    offload_thread_workers = T.int.min(1).default(16)
+    offload_process_workers = T.int.min(1).optional
+    offload_max_queue = T.int.min(0).default(64)
+    offload_queue_timeout = T.float.min(0).optional
+
+    # header of remaining seconds the caller waits, eg: 1.5
+    request_timeout_header = T.str.default("X-Request-Timeout")
+    # max seconds of handlers, overridden by max_timeout tag
+    handler_max_timeout = T.float.min(0).optional
 
     request_header_timeout = T.float.min(-1).default(60)
     request_body_timeout = T.float.min(-1).default(60)
@@ -47,10 +72,46 @@ class InternalConfig:
     request_max_body_size = T.int.min(0).default(1024 * 1024)
     request_header_buffer_size = T.int.min(1).default(1024)
     request_body_buffer_size = T.int.min(1).default(16 * 1024)
+    # uploaded files larger than it are spooled to temp files
+    request_form_spool_size = T.int.min(0).default(512 * 1024)
+    # max size of form fields kept in memory, set 0 to disable the limit
+    request_form_max_field_size = T.int.min(0).default(64 * 1024)
+    # set 0 to send response data immediately
+    response_flush_threshold = T.int.min(0).default(16 * 1024)
+    response_write_timeout = T.float.min(-1).default(60)
+    # granularity in seconds of connection deadlines
+    timer_granularity = T.float.min(0.01).default(1)
+
+    # validate handler returns always, never, or sampled by the rate
+    returns_validation = T.enum("always never sample").default("always")
+    returns_validation_sample_rate = T.float.min(0).max(1).default(0.01)
+
+    batch_enable = T.bool.default(False)
+    batch_path = T.str.default("batch")
+    batch_concurrency = T.int.min(1).default(8)
+    batch_max_size = T.int.min(1).default(50)
+
+    # streaming methods flush lines when either limit reached,
+    # set stream_flush_size 0 to flush every line
+    stream_flush_items = T.int.min(1).default(100)
+    stream_flush_size = T.int.min(0).default(16 * 1024)
+
+    # accept and return MessagePack of RPC methods, requires msgpack
+    msgpack_enable = T.bool.default(False)
 
     json_pretty = T.bool.optional
     json_sort_keys = T.bool.default(False)
+    # stdlib, ujson, orjson or import path of codec, eg: myapp.codec:Codec
+    json_backend = T.str.default("stdlib")
+    # deprecated, the same as json_backend = "ujson"
     json_ujson_enable = T.bool.default(False)
+    # encode returns by encoders precompiled from returns schema
+    json_precompile_enable = T.bool.default(True)
+    # large list is encoded item by item and sent chunked to bound memory,
+    # it's large if has min_items items or the estimated output reaches
+    # min_size bytes, set 0 to disable the check
+    json_incremental_min_items = T.int.min(0).default(10000)
+    json_incremental_min_size = T.int.min(0).default(1024 * 1024)
 
     reloader_enable = T.bool.optional
     reloader_extra_files = T.str.optional
@@ -82,12 +143,5 @@ class InternalConfig:
             self.json_pretty = self.debug
         if self.json_sort_keys is None:
             self.json_sort_keys = self.debug
-        self.__check_ujson()
-
-    def __check_ujson(self):
         if self.json_ujson_enable:
-            try:
-                import ujson  # noqa
-            except ModuleNotFoundError:
-                msg = "json_ujson_enable is set but ujson not installed!"
-                raise ConfigError(msg) from None
+            self.json_backend = "ujson"
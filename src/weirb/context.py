@@ -1,4 +1,5 @@
 import sys
+import time
 
 from .error import DependencyError
 from .compat.contextlib import AsyncExitStack
@@ -7,8 +8,12 @@ from .compat.contextlib import AsyncExitStack
 class Context:
     def __init__(self, app):
         self.config = app.config
+        self.json_codec = app.json_codec
+        self.msgpack_codec = app.msgpack_codec
         self.request = None
         self.response = None
+        # monotonic time of the request deadline
+        self.deadline = None
         self._config = app._config_dict
         self._scopes = app._scopes
         self._contexts = [c(self) for c in app.contexts]
@@ -16,6 +21,21 @@ class Context:
         self._container = {}
         self._providers = {}
 
+    def set_timeout(self, timeout):
+        """Set deadline by timeout in seconds, only if it's earlier"""
+        deadline = time.monotonic() + timeout
+        if self.deadline is None or deadline < self.deadline:
+            self.deadline = deadline
+
+    def remaining(self):
+        """Remaining seconds before the deadline, None if no deadline
+
+        Pass it to outbound calls as their timeout.
+        """
+        if self.deadline is None:
+            return None
+        return max(0, self.deadline - time.monotonic())
+
     def require(self, key):
         if key in self._config:
             return self._config[key]
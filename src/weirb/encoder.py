@@ -0,0 +1,135 @@
+"""JSON encoder precompiled from validr schema
+
+Field names, order and primitive types are known ahead of time, so the
+encoder is generated as straight-line Python code: keys are constant
+text, values are formatted without the generic type dispatch of
+`json.dumps`. Values which don't match the schema (eg: `any`, None of
+optional fields, returns not validated) fall back to the generic dumps.
+
+The output of validated value is the same as `json.dumps(value,
+ensure_ascii=False)`, except that dict keys are always in schema order.
+"""
+from json.encoder import encode_basestring
+
+from .jsoncodec import make_encoder
+
+_INT_VALIDATORS = {'int'}
+_FLOAT_VALIDATORS = {'float'}
+_BOOL_VALIDATORS = {'bool'}
+_FALLBACK_VALIDATORS = {'any'}
+
+
+class _CodeGen:
+
+    def __init__(self, fallback, sort_keys):
+        self.sort_keys = sort_keys
+        self.namespace = dict(
+            _fallback=fallback,
+            _str=encode_basestring,
+            _int=int.__repr__,
+            _float=float.__repr__,
+        )
+        self.lines = []
+        self.num_functions = 0
+        self.num_constants = 0
+        self.num_items = 0
+
+    def constant(self, value):
+        name = f'_c{self.num_constants}'
+        self.num_constants += 1
+        self.namespace[name] = value
+        return name
+
+    def literal(self, text):
+        """Literal text in the f-string"""
+        if "'" in text or '\\' in text:
+            return '{%s}' % self.constant(text)
+        return text.replace('{', '{{').replace('}', '}}')
+
+    def function(self, body):
+        name = f'_encode{self.num_functions}'
+        self.num_functions += 1
+        self.lines.append(f'def {name}(v):')
+        self.lines.extend('    ' + line for line in body)
+        self.lines.append('')
+        return name
+
+    def expr(self, schema, var):
+        """Expression which encodes var to JSON text"""
+        validator = schema.validator
+        if validator == 'dict':
+            if not schema.items:
+                return f'_fallback({var})'
+            return f'{self.dict_function(schema)}({var})'
+        if validator == 'list':
+            if schema.items is None:
+                return f'_fallback({var})'
+            return self.list_expr(schema, var)
+        if validator in _FALLBACK_VALIDATORS:
+            return f'_fallback({var})'
+        if validator in _INT_VALIDATORS:
+            return f'(_int({var}) if type({var}) is int else _fallback({var}))'
+        if validator in _FLOAT_VALIDATORS:
+            # NaN and Infinity are not finite, x - x is not 0
+            return (f'(_float({var}) if type({var}) is float and {var} - {var} == 0 '
+                    f'else _fallback({var}))')
+        if validator in _BOOL_VALIDATORS:
+            return (f'(("true" if {var} else "false") if type({var}) is bool '
+                    f'else _fallback({var}))')
+        # other validators output str mostly, eg: str, date, email
+        return f'(_str({var}) if type({var}) is str else _fallback({var}))'
+
+    def dict_function(self, schema):
+        keys = list(schema.items)
+        if self.sort_keys:
+            keys = sorted(keys)
+        body = [
+            f'if type(v) is not dict or len(v) != {len(keys)}:',
+            '    return _fallback(v)',
+            'try:',
+        ]
+        parts = []
+        for i, key in enumerate(keys):
+            body.append(f'    v{i} = v[{key!r}]')
+            prefix = '{' if i == 0 else ', '
+            text = prefix + encode_basestring(key) + ': '
+            parts.append(self.literal(text))
+            parts.append('{%s}' % self.expr(schema.items[key], f'v{i}'))
+        body.extend([
+            'except KeyError:',
+            '    return _fallback(v)',
+            "return f'%s}}'" % ''.join(parts),
+        ])
+        return self.function(body)
+
+    def list_expr(self, schema, var):
+        item = f'x{self.num_items}'
+        self.num_items += 1
+        expr = self.expr(schema.items, item)
+        return (f'("[" + ", ".join([{expr} for {item} in {var}]) + "]" '
+                f'if type({var}) is list else _fallback({var}))')
+
+    def compile(self, schema):
+        expr = self.expr(schema, 'v')
+        self.function([f"return {expr}.encode('utf-8')"])
+        source = '\n'.join(self.lines)
+        code = compile(source, '<json-encoder>', 'exec')
+        exec(code, self.namespace)
+        return self.namespace[f'_encode{self.num_functions - 1}'], source
+
+
+def compile_json_encoder(schema, sort_keys=False, fallback=None):
+    """Compile schema to a function which encodes value to JSON bytes
+
+    Args:
+        schema: validr schema
+        sort_keys: sort dict keys, same as json.dumps
+        fallback: the generic function which encodes value to JSON text,
+            default is json encoder
+    """
+    if fallback is None:
+        fallback = make_encoder(sort_keys)
+    codegen = _CodeGen(fallback, sort_keys)
+    encoder, source = codegen.compile(schema)
+    encoder.source = source
+    return encoder
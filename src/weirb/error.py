@@ -98,4 +98,11 @@ class ServiceInvalidParams(ServiceError):
     code = "Service.InvalidParams"
 
 
-BUILTIN_SERVICE_ERRORS = frozenset([ServiceInvalidParams])
+class ServiceTimeout(ServiceError):
+    """Request deadline exceeded"""
+
+    status = 504
+    code = "Service.Timeout"
+
+
+BUILTIN_SERVICE_ERRORS = frozenset([ServiceInvalidParams, ServiceTimeout])
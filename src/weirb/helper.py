@@ -15,6 +15,11 @@ async def stream(data):
     yield data
 
 
+async def stream_chunks(chunks):
+    for chunk in chunks:
+        yield chunk
+
+
 def is_terminal():
     return sys.stdout.isatty()
 
@@ -0,0 +1,176 @@
+"""JSON backends used to parse requests and serialize responses
+
+A codec works bytes-in and bytes-out:
+
+    loads(content: bytes) -> value, raises ValueError if invalid
+    dumps(value, *, indent=None, sort_keys=False) -> utf-8 bytes
+
+Builtin backends are stdlib, ujson and orjson, a user-provided codec is
+set by import path, eg: `myapp.codec:MyCodec`, class will be instanced.
+"""
+import json
+from importlib import import_module
+from json.encoder import encode_basestring
+
+try:
+    from json.encoder import c_make_encoder
+except ImportError:
+    c_make_encoder = None
+
+
+def make_encoder(sort_keys=False):
+    """Returns a function which encodes value to JSON text, the same
+    output as json.dumps(ensure_ascii=False)
+
+    `json.dumps` creates the C encoder on every call, which costs more than
+    encoding a small value, so the C encoder is created once if possible.
+    Circular reference check is disabled, values to encode are trees.
+    """
+    encoder = json.JSONEncoder(ensure_ascii=False, sort_keys=sort_keys)
+    if c_make_encoder is None:
+        return encoder.encode
+    iterencode = c_make_encoder(
+        None, encoder.default, encode_basestring, None,
+        encoder.key_separator, encoder.item_separator,
+        sort_keys, False, True)
+
+    def encode(value):
+        return ''.join(iterencode(value, 0))
+
+    return encode
+
+
+ESTIMATE_SAMPLES = 8
+# shorter lists are not estimated, the samples are encoded twice which
+# is a notable part of encoding a short list
+ESTIMATE_MIN_ITEMS = 16 * ESTIMATE_SAMPLES
+
+
+def estimate_list_size(items, encode):
+    """Estimate size of the encoded list by the leading items"""
+    samples = items[:ESTIMATE_SAMPLES]
+    if not samples:
+        return 2
+    size = sum(len(encode(x)) for x in samples)
+    return size * len(items) // len(samples) + 2 * len(items)
+
+
+def iter_encode_list(items, encode, separator=b', ', chunk_size=16 * 1024):
+    """Encode list item by item, yields JSON bytes chunks of about chunk_size
+
+    Only one chunk is kept in memory instead of the whole text and bytes.
+
+    Args:
+        items: the list
+        encode: function which encodes an item to JSON bytes
+        separator: item separator, the same as the codec
+        chunk_size: min bytes of chunks except the last one
+    """
+    chunk = [b'[']
+    size = 1
+    for i, item in enumerate(items):
+        data = encode(item)
+        if i:
+            chunk.append(separator)
+        chunk.append(data)
+        size += len(data)
+        if size >= chunk_size:
+            yield b''.join(chunk)
+            chunk = []
+            size = 0
+    chunk.append(b']')
+    yield b''.join(chunk)
+
+
+class StdlibJsonCodec:
+    name = 'stdlib'
+
+    def __init__(self):
+        self._encoders = {
+            False: make_encoder(sort_keys=False),
+            True: make_encoder(sort_keys=True),
+        }
+
+    def loads(self, content):
+        return json.loads(content)
+
+    def dumps(self, value, *, indent=None, sort_keys=False):
+        if indent is None:
+            text = self._encoders[bool(sort_keys)](value)
+        else:
+            text = json.dumps(
+                value, ensure_ascii=False, indent=indent, sort_keys=sort_keys)
+        return text.encode('utf-8')
+
+
+class UjsonCodec:
+    name = 'ujson'
+
+    def __init__(self):
+        import ujson
+        self._ujson = ujson
+
+    def loads(self, content):
+        return self._ujson.loads(content)
+
+    def dumps(self, value, *, indent=None, sort_keys=False):
+        text = self._ujson.dumps(
+            value,
+            ensure_ascii=False,
+            escape_forward_slashes=False,
+            indent=indent or 0,
+            sort_keys=sort_keys,
+        )
+        return text.encode('utf-8')
+
+
+class OrjsonCodec:
+    """orjson only supports indent of 2 spaces"""
+
+    name = 'orjson'
+
+    def __init__(self):
+        import orjson
+        self._orjson = orjson
+
+    def loads(self, content):
+        return self._orjson.loads(content)
+
+    def dumps(self, value, *, indent=None, sort_keys=False):
+        option = self._orjson.OPT_NON_STR_KEYS
+        if indent:
+            option |= self._orjson.OPT_INDENT_2
+        if sort_keys:
+            option |= self._orjson.OPT_SORT_KEYS
+        return self._orjson.dumps(value, option=option)
+
+
+JSON_BACKENDS = dict(
+    stdlib=StdlibJsonCodec,
+    ujson=UjsonCodec,
+    orjson=OrjsonCodec,
+)
+
+
+def load_json_codec(backend):
+    """Load codec by backend name or import path of user-provided codec
+
+    Raises:
+        ImportError: the backend not installed or not found
+        TypeError: the user-provided codec is invalid
+    """
+    if backend in JSON_BACKENDS:
+        return JSON_BACKENDS[backend]()
+    module_name, sep, name = backend.partition(':')
+    if not sep:
+        raise ImportError(f'unknown json backend {backend!r}')
+    codec = getattr(import_module(module_name), name, None)
+    if codec is None:
+        raise ImportError(f'json backend {backend!r} not found')
+    if isinstance(codec, type):
+        codec = codec()
+    loads = getattr(codec, 'loads', None)
+    dumps = getattr(codec, 'dumps', None)
+    if not (callable(loads) and callable(dumps)):
+        raise TypeError(f'json backend {backend!r} should has loads and dumps')
+    return codec
@@ -0,0 +1,32 @@
+"""MessagePack wire format of RPC methods
+
+The codec has the same interface as JSON codecs, bytes-in and bytes-out.
+Binary data is packed as bin type, and unpacked as bytes.
+"""
+try:
+    import msgpack
+    from msgpack.exceptions import UnpackException
+except ModuleNotFoundError:
+    msgpack = None
+
+MSGPACK_MIMETYPE = 'application/msgpack'
+MSGPACK_MIMETYPES = frozenset([MSGPACK_MIMETYPE, 'application/x-msgpack'])
+
+
+class MsgpackCodec:
+    name = 'msgpack'
+    mimetype = MSGPACK_MIMETYPE
+
+    def __init__(self):
+        if msgpack is None:
+            raise ImportError('msgpack not installed')
+
+    def loads(self, content):
+        try:
+            return msgpack.unpackb(content, raw=False)
+        except (UnpackException, ValueError) as ex:
+            raise ValueError(f'Invalid MessagePack data: {ex}') from ex
+
+    def dumps(self, value, *, indent=None, sort_keys=False):
+        """indent and sort_keys are not supported, they're ignored"""
+        return msgpack.packb(value, use_bin_type=True)
@@ -0,0 +1,213 @@
+"""Streaming multipart/form-data parser
+
+Parts are parsed incrementally from the request body chunks, part data
+is streamed and never buffered as a whole, so memory usage is bounded
+no matter how large the upload is.
+"""
+from tempfile import SpooledTemporaryFile
+
+from werkzeug.http import parse_options_header
+from werkzeug.datastructures import Headers, FileStorage
+
+from .error import BadRequest, RequestEntityTooLarge
+
+CRLF = b'\r\n'
+HEADERS_END = b'\r\n\r\n'
+
+
+class MultipartPart:
+    """A part of multipart body, iterate it to read the data by chunks"""
+
+    def __init__(self, reader, headers: Headers):
+        self._data = reader._read_data()
+        self.headers = headers
+        disposition, options = parse_options_header(
+            headers.get('Content-Disposition', ''))
+        self.disposition = disposition
+        self.name = options.get('name')
+        self.filename = options.get('filename')
+        self.content_type = headers.get('Content-Type')
+
+    def __repr__(self):
+        return f'<{type(self).__name__} {self.name!r} {self.filename!r}>'
+
+    @property
+    def is_file(self):
+        return self.filename is not None
+
+    def __aiter__(self):
+        return self._data
+
+    async def read(self, max_size=None):
+        """Read all data of the part
+
+        Raises:
+            RequestEntityTooLarge: data larger than max_size
+        """
+        chunks = []
+        size = 0
+        async for chunk in self._data:
+            size += len(chunk)
+            if max_size is not None and size > max_size:
+                raise RequestEntityTooLarge(f'Multipart part {self.name!r} too large')
+            chunks.append(chunk)
+        return b''.join(chunks)
+
+    async def spool(self, max_size):
+        """Read all data of the part to a file, in memory until max_size"""
+        file = SpooledTemporaryFile(max_size=max_size)
+        try:
+            async for chunk in self._data:
+                file.write(chunk)
+        except BaseException:
+            file.close()
+            raise
+        file.seek(0)
+        return file
+
+
+class MultipartReader:
+    """Incremental multipart parser fed from request body chunks
+
+    Usage:
+
+        async for part in MultipartReader(request.body, boundary):
+            async for chunk in part:
+                ...
+
+    Data not read of a part is skipped when iterate to the next part.
+
+    Raises:
+        BadRequest: multipart body invalid or incomplete
+    """
+
+    def __init__(self, body, boundary: bytes, max_header_size=8 * 1024):
+        if not boundary:
+            raise BadRequest('Missing multipart boundary')
+        self._body = body.__aiter__()
+        self._delimiter = CRLF + b'--' + boundary
+        self.max_header_size = max_header_size
+        # the leading CRLF let the first boundary match the delimiter
+        self._buffer = bytearray(CRLF)
+
+    async def _fill(self):
+        try:
+            chunk = await self._body.__anext__()
+        except StopAsyncIteration:
+            raise BadRequest('Incomplete multipart body') from None
+        self._buffer += chunk
+
+    async def _read_data(self):
+        """Read data until next delimiter, and consume the delimiter"""
+        buffer = self._buffer
+        delimiter = self._delimiter
+        while True:
+            index = buffer.find(delimiter)
+            if index >= 0:
+                if index > 0:
+                    yield bytes(buffer[:index])
+                del buffer[:index + len(delimiter)]
+                return
+            # keep the tail which may be prefix of delimiter
+            safe = len(buffer) - len(delimiter) + 1
+            if safe > 0:
+                yield bytes(buffer[:safe])
+                del buffer[:safe]
+            await self._fill()
+
+    async def _read_headers(self):
+        buffer = self._buffer
+        while True:
+            if buffer.startswith(CRLF):
+                # part without headers
+                del buffer[:len(CRLF)]
+                return Headers()
+            index = buffer.find(HEADERS_END)
+            if index >= 0:
+                break
+            if len(buffer) > self.max_header_size:
+                raise BadRequest('Multipart headers too large')
+            await self._fill()
+        lines = bytes(buffer[:index]).decode('utf-8', 'replace').split('\r\n')
+        del buffer[:index + len(HEADERS_END)]
+        headers = Headers()
+        for line in lines:
+            name, sep, value = line.partition(':')
+            if not sep:
+                raise BadRequest('Invalid multipart headers')
+            headers.add(name.strip(), value.strip())
+        return headers
+
+    async def _read_delimiter_end(self):
+        """Returns True if it's the close delimiter"""
+        buffer = self._buffer
+        while len(buffer) < 2:
+            await self._fill()
+        if buffer.startswith(b'--'):
+            return True
+        # transport padding is allowed after the delimiter
+        while CRLF not in buffer:
+            if len(buffer) > self.max_header_size:
+                raise BadRequest('Invalid multipart boundary')
+            await self._fill()
+        index = buffer.find(CRLF)
+        if buffer[:index].strip(b' \t'):
+            raise BadRequest('Invalid multipart boundary')
+        del buffer[:index + len(CRLF)]
+        return False
+
+    async def __aiter__(self):
+        # skip preamble
+        async for _ in self._read_data():  # noqa: F841
+            pass
+        while not await self._read_delimiter_end():
+            headers = await self._read_headers()
+            part = MultipartPart(self, headers)
+            yield part
+            async for _ in part:  # noqa: F841
+                pass
+        # skip epilogue
+        self._buffer.clear()
+        async for _ in self._body:  # noqa: F841
+            pass
+
+
+async def parse_multipart(parts, charset='utf-8', spool_size=1024 * 1024,
+                          max_field_size=None):
+    """Parse multipart into form fields and files
+
+    Fields are kept in memory and limited by max_field_size, None means
+    unlimited, files are spooled to temp files when larger than spool_size.
+
+    Raises:
+        RequestEntityTooLarge: field larger than max_field_size
+
+    Returns:
+        tuple of (fields, files), both are list of (name, value)
+    """
+    fields = []
+    files = []
+    try:
+        async for part in parts:
+            if part.is_file:
+                stream = await part.spool(spool_size)
+                files.append((part.name, FileStorage(
+                    stream=stream,
+                    filename=part.filename,
+                    name=part.name,
+                    content_type=part.content_type,
+                    headers=part.headers,
+                )))
+            else:
+                content = await part.read(max_size=max_field_size)
+                try:
+                    value = content.decode(charset)
+                except UnicodeDecodeError as ex:
+                    msg = 'Bad multipart field encoding or incorrect charset'
+                    raise BadRequest(msg) from ex
+                fields.append((part.name, value))
+    except BaseException:
+        for __, storage in files:
+            storage.close()
+        raise
+    return fields, files
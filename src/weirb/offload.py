@@ -0,0 +1,61 @@
+import time
+
+from newio import run_in_thread, run_in_process
+
+from .bulkhead import Bulkhead
+
+OFFLOAD_KINDS = {'thread', 'process'}
+
+
+class OffloadPool:
+    """Bounded pool which runs blocking functions in threads or processes
+
+    At most max_workers functions run at the same time, others wait in
+    the FIFO queue, see Bulkhead. Functions are executed by the newio
+    kernel executors, max_workers should not exceed the executor size.
+    """
+
+    def __init__(self, kind, max_workers, max_queue=0, queue_timeout=None):
+        if kind not in OFFLOAD_KINDS:
+            raise ValueError(f'unknown offload kind {kind!r}')
+        self.kind = kind
+        self.bulkhead = Bulkhead(
+            f'{kind} pool', max_workers,
+            max_queue=max_queue, queue_timeout=queue_timeout)
+        if kind == 'thread':
+            self._run = run_in_thread
+        else:
+            self._run = run_in_process
+        self.executions = 0
+        self.errors = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+
+    def __repr__(self):
+        return f'<{type(self).__name__} {self.kind} {self.bulkhead.info()}>'
+
+    async def run(self, fn, *args, **kwargs):
+        async with self.bulkhead:
+            begin = time.monotonic()
+            try:
+                return await self._run(fn, *args, **kwargs)
+            except Exception:
+                self.errors += 1
+                raise
+            finally:
+                cost = time.monotonic() - begin
+                self.executions += 1
+                self.total_time += cost
+                self.max_time = max(self.max_time, cost)
+
+    def info(self):
+        avg_time = 0.0
+        if self.executions:
+            avg_time = self.total_time / self.executions
+        return dict(
+            **self.bulkhead.info(),
+            executions=self.executions,
+            errors=self.errors,
+            avg_time=avg_time,
+            max_time=self.max_time,
+        )
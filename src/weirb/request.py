@@ -1,4 +1,3 @@
-import json
 from io import BytesIO
 from urllib.parse import parse_qsl, urlparse
 
@@ -12,7 +11,6 @@ from werkzeug.http import (
     parse_cookie,
 )
 from werkzeug.datastructures import (
-    Headers,
     ImmutableMultiDict,
     MIMEAccept,
     CharsetAccept,
@@ -20,7 +18,9 @@ from werkzeug.datastructures import (
 )
 
 from .server import RawRequest
-from .error import BadRequest
+from .error import BadRequest, UnsupportedMediaType
+from .multipart import MultipartReader, parse_multipart
+from .msgpackcodec import MSGPACK_MIMETYPES
 
 
 class RequestUrlMixin:
@@ -91,6 +91,24 @@ class RequestHeadersMixin:
             return True
         return False
 
+    @cached_property
+    def is_msgpack(self):
+        """Indicates if this request is MessagePack or not."""
+        return self.mimetype in MSGPACK_MIMETYPES
+
+    @cached_property
+    def accept_msgpack(self):
+        """Whether the client prefers MessagePack to JSON response
+
+        If no Accept header, the same format as the request is used.
+        """
+        if 'Accept' not in self.headers:
+            return self.is_msgpack
+        # JSON is preferred if the qualities are equal
+        best = self.accept_mimetypes.best_match(
+            ['application/json', *sorted(MSGPACK_MIMETYPES)])
+        return best in MSGPACK_MIMETYPES
+
     @cached_property
     def is_form(self):
         """Indicates if this request is Form or not."""
@@ -164,6 +182,7 @@ class RequestBodyMixin:
         self._content = _NOT_READ
         self._text = _NOT_READ
         self._json = _NOT_READ
+        self._msgpack = _NOT_READ
         self._form = _NOT_READ
         self._files = _NOT_READ
 
@@ -194,11 +213,27 @@ class RequestBodyMixin:
                 raise BadRequest(msg)
             content = await self.content()
             try:
-                self._json = json.loads(content)
-            except json.JSONDecodeError as ex:
+                self._json = self.context.json_codec.loads(content)
+            except ValueError as ex:
                 raise BadRequest('Invalid JSON') from ex
         return self._json
 
+    async def msgpack(self):
+        if self._msgpack is _NOT_READ:
+            if not self.is_msgpack:
+                msg = ('The request has no MessagePack data, or missing '
+                       'content-type header, eg: application/msgpack')
+                raise BadRequest(msg)
+            codec = self.context.msgpack_codec
+            if codec is None:
+                raise UnsupportedMediaType('MessagePack is not enabled')
+            content = await self.content()
+            try:
+                self._msgpack = codec.loads(content)
+            except ValueError as ex:
+                raise BadRequest('Invalid MessagePack') from ex
+        return self._msgpack
+
     async def form(self):
         if self._form is _NOT_READ:
             await self._parse_form_data()
@@ -209,6 +244,24 @@ class RequestBodyMixin:
             await self._parse_form_data()
         return self._files
 
+    async def parts(self):
+        """Iterate parts of multipart/form-data body as a stream
+
+        Usage:
+
+            async for part in request.parts():
+                async for chunk in part:
+                    ...
+        """
+        if self.mimetype != 'multipart/form-data':
+            msg = ('The request has no multipart data, or missing '
+                   'content-type header, eg: multipart/form-data')
+            raise BadRequest(msg)
+        boundary = self.mimetype_params.get('boundary', '').encode('latin-1')
+        reader = MultipartReader(self.body, boundary)
+        async for part in reader:
+            yield part
+
     async def _parse_form_data(self):
         if not self.is_form:
             msg = ('The request no form data, or missing form '
@@ -217,6 +270,14 @@ class RequestBodyMixin:
         if not self.body or self.method not in {'POST', 'PUT', 'PATCH'}:
             self._form = self._files = None
             return
+        if self.mimetype == 'multipart/form-data':
+            charset = self.mimetype_params.get('charset', 'utf-8')
+            fields, files = await parse_multipart(
+                self.parts(), charset=charset, spool_size=self._form_spool_size,
+                max_field_size=self._form_max_field_size or None)
+            self._form = ImmutableMultiDict(fields)
+            self._files = ImmutableMultiDict(files)
+            return
         content = await self.content()
         environ = {
             'wsgi.input': BytesIO(content),
@@ -237,6 +298,8 @@ class Request(RequestUrlMixin, RequestHeadersMixin, RequestBodyMixin):
         self.raw = raw
         self.path_params = {}
         self._xheaders = context.config.xheaders
+        self._form_spool_size = context.config.request_form_spool_size
+        self._form_max_field_size = context.config.request_form_max_field_size
         self._body_readed = False
 
     @property
@@ -251,14 +314,23 @@ class Request(RequestUrlMixin, RequestHeadersMixin, RequestBodyMixin):
     def version(self):
         return self.raw.version
 
-    @cached_property
+    @property
     def headers(self):
-        return Headers(self.raw.headers)
+        return self.raw.headers
 
     @property
     def body(self):
         return self.raw.body
 
+    @property
+    def max_body_size(self):
+        """Body size limit, changes only take effect before reading body"""
+        return self.raw.max_body_size
+
+    @max_body_size.setter
+    def max_body_size(self, value):
+        self.raw.max_body_size = value
+
     @cached_property
     def remote_ip(self):
         if not self._xheaders:
@@ -1,17 +1,20 @@
+import os
 import inspect
-import json
-try:
-    import ujson
-except ModuleNotFoundError:
-    ujson = None
 from http import HTTPStatus
 from werkzeug.http import dump_cookie
 from werkzeug.datastructures import Headers
 
-from .server import AbstractResponse, ErrorResponse
-from .helper import stream, HTTP_REDIRECT_STATUS
+from .server import AbstractResponse, ErrorResponse, FileBody
+from .helper import stream, stream_chunks, HTTP_REDIRECT_STATUS
+from .jsoncodec import (
+    StdlibJsonCodec,
+    estimate_list_size,
+    iter_encode_list,
+    ESTIMATE_MIN_ITEMS,
+)
+from .msgpackcodec import MSGPACK_MIMETYPE
 
-__all__ = ('AbstractResponse', 'ErrorResponse', 'Response',)
+__all__ = ('AbstractResponse', 'ErrorResponse', 'FileBody', 'Response',)
 
 
 class ResponseCookieMixin:
@@ -118,23 +121,82 @@ class Response(AbstractResponse, ResponseCookieMixin, ResponseRedirectMixin):
             self.content_length = len(value)
         elif inspect.isasyncgen(value):
             self._body = value
+            self.content_length = None
+        elif isinstance(value, (FileBody, os.PathLike)) or hasattr(value, 'read'):
+            if not isinstance(value, FileBody):
+                value = FileBody(value)
+            self._body = value
+            self.content_length = len(value)
         else:
-            msg = (f'response body should be bytes, str or async generator, '
-                   f'type {type(value).__name__} is not supported')
+            msg = (f'response body should be bytes, str, async generator, '
+                   f'file or path, type {type(value).__name__} is not supported')
             raise ValueError(msg)
 
+    def dump_json(self, value):
+        """Serialize value to JSON bytes by json configs"""
+        config = self.context.config
+        indent = 4 if config.json_pretty else None
+        return self.context.json_codec.dumps(
+            value, indent=indent, sort_keys=config.json_sort_keys)
+
+    def _is_large_list(self, items, encode_item):
+        config = self.context.config
+        min_items = config.json_incremental_min_items
+        if min_items and len(items) >= min_items:
+            return True
+        min_size = config.json_incremental_min_size
+        if not min_size or len(items) < ESTIMATE_MIN_ITEMS:
+            return False
+        return estimate_list_size(items, encode_item) >= min_size
+
+    def dump_json_chunks(self, value, encode_item=None):
+        """Serialize large list to async generator of JSON bytes chunks,
+        returns None if value is not a large list
+
+        Args:
+            value: value to serialize
+            encode_item: function which encodes an item to JSON bytes,
+                default is the JSON codec
+        """
+        config = self.context.config
+        if type(value) is not list or config.json_pretty:
+            return None
+        codec = self.context.json_codec
+        if encode_item is None:
+            def encode_item(item):
+                return codec.dumps(item, sort_keys=config.json_sort_keys)
+        if not self._is_large_list(value, encode_item):
+            return None
+        # the same separator as encoding the list at once
+        separator = b', ' if isinstance(codec, StdlibJsonCodec) else b','
+        chunks = iter_encode_list(
+            value, encode_item, separator=separator,
+            chunk_size=config.response_flush_threshold)
+        return stream_chunks(chunks)
+
+    def dump_msgpack(self, value):
+        """Serialize value to MessagePack bytes"""
+        return self.context.msgpack_codec.dumps(value)
+
+    def msgpack(self, value):
+        self.msgpack_content(self.dump_msgpack(value))
+
+    def msgpack_content(self, content: bytes):
+        """Set MessagePack body which is already serialized"""
+        self.body = content
+        self.headers['Content-Type'] = MSGPACK_MIMETYPE
+
     def json(self, value):
-        sort_keys = self.context.config.json_sort_keys
-        indent = None
-        if self.context.config.json_pretty:
-            indent = 4
-        if self.context.config.json_ujson_enable:
-            dumps = ujson.dumps
-        else:
-            dumps = json.dumps
-        text = dumps(
-            value, ensure_ascii=False, indent=indent, sort_keys=sort_keys)
-        self.body = text.encode('utf-8')
+        content = self.dump_json_chunks(value)
+        if content is None:
+            content = self.dump_json(value)
+        self.json_content(content)
+
+    def json_content(self, content):
+        """Set JSON body which is already serialized, content is bytes or
+        async generator of bytes chunks which is sent chunked"""
+        self.body = content
+        self.chunked = inspect.isasyncgen(content)
         self.headers['Content-Type'] = 'application/json;charset=utf-8'
 
     @property
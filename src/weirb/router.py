@@ -1,10 +1,13 @@
+import re
 import logging
-import functools
+from collections import OrderedDict
 
 from werkzeug.routing import (
-    Map, Rule,
-    NotFound as WZ_NotFound,
-    MethodNotAllowed as WZ_MethodNotAllowed,
+    Map,
+    PathConverter,
+    parse_rule,
+    parse_converter_args,
+    ValidationError,
     RequestRedirect as WZ_RequestRedirect,
 )
 
@@ -13,30 +16,341 @@ from .error import NotFound, MethodNotAllowed, HttpRedirect
 LOG = logging.getLogger(__name__)
 
 
+def _is_rest_converter(converter):
+    """Whether the converter can match slashes"""
+    part_isolating = getattr(converter, 'part_isolating', None)
+    if part_isolating is not None:
+        return not part_isolating
+    return isinstance(converter, PathConverter)
+
+
+def _methods_table(methods, handler, table):
+    methods = set(methods)
+    if 'GET' in methods:
+        methods.add('HEAD')
+    for method in methods:
+        # the first added route wins, same as werkzeug
+        table.setdefault(method, handler)
+
+
+class LRUCache:
+    """Bounded LRU cache with hit, miss and eviction counters"""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        try:
+            value = self._data[key]
+        except KeyError:
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key, value):
+        if self.maxsize <= 0:
+            return
+        self._data[key] = value
+        self._data.move_to_end(key)
+        if len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        self._data.clear()
+
+    def info(self):
+        return dict(
+            hits=self.hits,
+            misses=self.misses,
+            evictions=self.evictions,
+            size=len(self._data),
+            maxsize=self.maxsize,
+        )
+
+
+class _Pattern:
+    """Compiled parameterized path pattern
+
+    A pattern matches one segment, or the rest of the path if it contains
+    converters which can match slashes, eg: path converter.
+    """
+
+    def __init__(self, items, is_rest):
+        self.is_rest = is_rest
+        self.converters = {}
+        regex = []
+        weight = 0
+        for item in items:
+            if isinstance(item, str):
+                regex.append(re.escape(item))
+                weight -= len(item)
+            else:
+                name, converter = item
+                self.converters[name] = converter
+                regex.append(f'(?P<{name}>{converter.regex})')
+                weight += getattr(converter, 'weight', 100)
+        self.key = ''.join(regex)
+        self.regex = re.compile(self.key)
+        # static text first, then cheaper converters
+        self.weight = (is_rest, weight)
+        self.node = _Node()
+
+    def match(self, value):
+        match = self.regex.fullmatch(value)
+        if match is None:
+            return None
+        params = {}
+        for name, text in match.groupdict().items():
+            try:
+                params[name] = self.converters[name].to_python(text)
+            except ValidationError:
+                return None
+        return params
+
+
+class _Node:
+    """Radix tree node, one level per path segment"""
+
+    __slots__ = ('children', 'patterns', 'methods')
+
+    def __init__(self):
+        self.children = {}
+        self.patterns = []
+        self.methods = None
+
+    def add_pattern(self, pattern):
+        for exists in self.patterns:
+            if exists.key == pattern.key and exists.is_rest == pattern.is_rest:
+                return exists
+        self.patterns.append(pattern)
+        self.patterns.sort(key=lambda x: x.weight)
+        return pattern
+
+    def iter_match(self, segments, index, params):
+        """Yield (methods table, params) of all matched routes by priority"""
+        if index == len(segments):
+            if self.methods is not None:
+                yield self.methods, params
+            return
+        child = self.children.get(segments[index])
+        if child is not None:
+            yield from child.iter_match(segments, index + 1, params)
+        for pattern in self.patterns:
+            if pattern.is_rest:
+                value = '/'.join(segments[index:])
+                next_index = len(segments)
+            else:
+                value = segments[index]
+                next_index = index + 1
+            matched = pattern.match(value)
+            if matched is None:
+                continue
+            yield from pattern.node.iter_match(
+                segments, next_index, {**params, **matched})
+
+
 class Router:
-    def __init__(self, services, server_name):
+    """Router compiled from handler routes
+
+    Static paths are looked up by a dict, parameterized paths by a radix
+    tree of path segments, rules syntax and converters are the same as
+    werkzeug routing.
+
+    RPC methods are resolved by an exact-match dict before any other
+    routing.
+
+    Errors (not found, method not allowed, redirect) are cached per
+    router by path in a bounded LRU cache. Matched routes are not cached:
+    static paths are already a dict lookup, and caching paths with params
+    eg: /user/123 would let the IDs evict each other.
+    """
+
+    def __init__(self, services, server_name, extra_handlers=(),
+                 negative_cache_size=1024):
         self.services = services
         self.server_name = server_name
-        url_map = []
-        for service in services:
-            for handler in service.handlers:
-                for route in handler.routes:
-                    url_map.append(Rule(
-                        route.path,
-                        methods=route.methods,
-                        endpoint=handler,
-                    ))
-        self.url_map = Map(url_map)
-
-    @functools.lru_cache(maxsize=1024)
+        self.handlers = [h for service in services for h in service.handlers]
+        self.handlers.extend(extra_handlers)
+        self._static_hits = 0
+        self._static_misses = 0
+        self._negative_cache = LRUCache(negative_cache_size)
+        self._converter_map = Map()
+        self._static = {}
+        self._root = _Node()
+        for handler in self.handlers:
+            for route in handler.routes:
+                self._add_route(route.path, route.methods, handler)
+        self._rpc_methods = self._build_rpc_methods()
+
+    def _build_rpc_methods(self):
+        """RPC methods are static POST routes, path -> handler"""
+        rpc_methods = {}
+        for handler in self.handlers:
+            if not handler.is_method:
+                continue
+            for route in handler.routes:
+                table = self._static.get(route.path)
+                # skip if overridden by other routes
+                if table is not None and table.get('POST') is handler:
+                    rpc_methods[route.path] = handler
+        return rpc_methods
+
+    def _create_converter(self, name, args):
+        converter_class = self._converter_map.converters.get(name)
+        if converter_class is None:
+            raise LookupError(f'the converter {name!r} does not exist')
+        if args:
+            args, kwargs = parse_converter_args(args)
+        else:
+            args, kwargs = (), {}
+        return converter_class(self._converter_map, *args, **kwargs)
+
+    def _parse_segments(self, path):
+        """Split rule into segments, each is a list of static text and
+        (name, converter) items, returns (segments, rest)
+
+        The rest is items since the first converter which may match
+        slashes, they are matched as a whole.
+        """
+        segments = [[]]
+        rest = None
+        for converter, args, variable in parse_rule(path):
+            if converter is None:
+                texts = variable.split('/')
+                if rest is not None:
+                    rest.append(variable)
+                    continue
+                if texts[0]:
+                    segments[-1].append(texts[0])
+                for text in texts[1:]:
+                    segments.append([text] if text else [])
+                continue
+            converter = self._create_converter(converter, args)
+            item = (variable, converter)
+            if rest is None and _is_rest_converter(converter):
+                rest = segments.pop()
+            if rest is not None:
+                rest.append(item)
+            else:
+                segments[-1].append(item)
+        # the leading empty segment before root slash
+        return segments[1:], rest
+
+    def _add_route(self, path, methods, handler):
+        segments, rest = self._parse_segments(path)
+        is_static = rest is None and all(
+            isinstance(item, str) for segment in segments for item in segment)
+        if is_static:
+            table = self._static.setdefault(path, {})
+            _methods_table(methods, handler, table)
+            return
+        node = self._root
+        for segment in segments:
+            if all(isinstance(item, str) for item in segment):
+                key = ''.join(segment)
+                node = node.children.setdefault(key, _Node())
+            else:
+                node = node.add_pattern(_Pattern(segment, is_rest=False)).node
+        if rest is not None:
+            node = node.add_pattern(_Pattern(rest, is_rest=True)).node
+        if node.methods is None:
+            node.methods = {}
+        _methods_table(methods, handler, node.methods)
+
+    def _iter_match(self, path):
+        table = self._static.get(path)
+        if table is not None:
+            yield table, {}
+        if not path.startswith('/'):
+            return
+        segments = path[1:].split('/')
+        yield from self._root.iter_match(segments, 0, {})
+
+    def _redirect_location(self, path):
+        if self.server_name:
+            return f'http://{self.server_name}{path}'
+        return path
+
+    def _match(self, path, method):
+        """Returns (handler, params), or (None, None) if not matched
+
+        Raises:
+            MethodNotAllowed: path matched but method not allowed
+        """
+        method_not_allowed = False
+        for table, params in self._iter_match(path):
+            handler = table.get(method)
+            if handler is not None:
+                return handler, params
+            method_not_allowed = True
+        if method_not_allowed:
+            raise MethodNotAllowed()
+        return None, None
+
+    def _lookup(self, path, method):
+        handler, params = self._match(path, method)
+        if handler is not None:
+            return handler, params
+        # strict slashes, redirect to the route ends with slash
+        if not path.endswith('/'):
+            handler, __ = self._match(path + '/', method)
+            if handler is not None:
+                location = self._redirect_location(path + '/')
+                raise HttpRedirect(location, status=WZ_RequestRedirect.code)
+        raise NotFound()
+
     def lookup(self, path, method):
-        url = self.url_map.bind(server_name=self.server_name)
+        """Returns (handler, path params)
+
+        Raises:
+            NotFound: no route matched
+            MethodNotAllowed: path matched but method not allowed
+            HttpRedirect: redirect to the route ends with slash
+        """
+        if method == 'POST':
+            handler = self._rpc_methods.get(path)
+            if handler is not None:
+                return handler, {}
+        # static routes win, same as _match
+        table = self._static.get(path)
+        if table is not None:
+            handler = table.get(method)
+            if handler is not None:
+                self._static_hits += 1
+                return handler, {}
+        self._static_misses += 1
+        key = (path, method)
+        error = self._negative_cache.get(key)
+        if error is not None:
+            error_class, args = error
+            raise error_class(*args)
         try:
-            handler, arguments = url.match(path_info=path, method=method)
-        except WZ_NotFound as ex:
-            raise NotFound() from None
-        except WZ_MethodNotAllowed as ex:
-            raise MethodNotAllowed() from None
-        except WZ_RequestRedirect as ex:
-            raise HttpRedirect(ex.new_url, status=ex.code)
-        return handler, arguments
+            return self._lookup(path, method)
+        except HttpRedirect as ex:
+            self._negative_cache.set(key, (HttpRedirect, (ex.location, ex.status)))
+            raise
+        except (NotFound, MethodNotAllowed) as ex:
+            self._negative_cache.set(key, (type(ex), ()))
+            raise
+
+    def cache_info(self):
+        """Counters of static routes table and negative cache"""
+        static = dict(
+            hits=self._static_hits,
+            misses=self._static_misses,
+            size=len(self._static),
+        )
+        return dict(
+            routes=static,
+            errors=self._negative_cache.info(),
+        )
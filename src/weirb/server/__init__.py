@@ -1,5 +1,13 @@
 from .server import serve
 from .request import RawRequest
-from .response import AbstractResponse, ErrorResponse
+from .headers import RequestHeaders
+from .response import AbstractResponse, ErrorResponse, FileBody
 
-__all__ = ('serve', 'RawRequest', 'AbstractResponse', 'ErrorResponse',)
+__all__ = (
+    'serve',
+    'RawRequest',
+    'RequestHeaders',
+    'AbstractResponse',
+    'ErrorResponse',
+    'FileBody',
+)
@@ -0,0 +1,113 @@
+import socket
+import logging
+
+from ..error import ServiceUnavailable
+from .timer import WRITE
+
+LOG = logging.getLogger(__name__)
+
+# shed connections linger to drain the request, then the client can read
+# the 503 response instead of getting a connection reset
+SHED_LINGER_TIMEOUT = 1
+SHED_DRAIN_SIZE = 64 * 1024
+SHED_BUFFER_SIZE = 4 * 1024
+
+
+def _format_overload_response(retry_after):
+    body = str(ServiceUnavailable('Server is overloaded')).encode('utf-8')
+    headers = [
+        f'HTTP/1.1 {ServiceUnavailable.status} {ServiceUnavailable.phrase}',
+        f'Content-Length: {len(body)}',
+        f'Retry-After: {retry_after}',
+        'Connection: close',
+    ]
+    return '\r\n'.join(headers).encode() + b'\r\n\r\n' + body
+
+
+class Admission:
+    """Connection admission control and in-flight requests accounting
+
+    Limits of 0 means unlimited. When saturated, the server sheds load
+    with the pre-built `overload_response` and closes the connection
+    instead of queuing.
+    """
+
+    def __init__(self, max_connections=0, max_requests=0, retry_after=1):
+        self.max_connections = max_connections
+        self.max_requests = max_requests
+        self.overload_response = _format_overload_response(retry_after)
+        self.connections = 0
+        self.requests = 0
+        self.shed_connections = 0
+        self.shed_requests = 0
+
+    def __repr__(self):
+        return (f'<{type(self).__name__} connections={self.connections} '
+                f'requests={self.requests}>')
+
+    @property
+    def occupancy(self):
+        """Current occupancy, for instrumentation"""
+        return dict(
+            connections=self.connections,
+            max_connections=self.max_connections,
+            requests=self.requests,
+            max_requests=self.max_requests,
+            shed_connections=self.shed_connections,
+            shed_requests=self.shed_requests,
+        )
+
+    def admit_connection(self):
+        if self.max_connections and self.connections >= self.max_connections:
+            self.shed_connections += 1
+            return False
+        self.connections += 1
+        return True
+
+    def release_connection(self):
+        self.connections -= 1
+
+    def admit_request(self):
+        if self.max_requests and self.requests >= self.max_requests:
+            self.shed_requests += 1
+            return False
+        self.requests += 1
+        return True
+
+    def release_request(self):
+        self.requests -= 1
+
+    async def linger(self, cli_sock, deadline):
+        """Shutdown the write side and drain the request before closing
+
+        Closing with unread request data makes the kernel send RST, and the
+        client may drop the response before reading it. So the write side
+        is shutdown first, then the request is drained until EOF, or the
+        drain limit or the linger deadline reached.
+        """
+        deadline.set(WRITE, SHED_LINGER_TIMEOUT)
+        try:
+            cli_sock.socket.shutdown(socket.SHUT_WR)
+            drained = 0
+            while drained < SHED_DRAIN_SIZE:
+                data = await cli_sock.recv(SHED_BUFFER_SIZE)
+                if not data:
+                    break
+                drained += len(data)
+        except OSError as ex:
+            LOG.debug('Failed to drain shed connection: %r', ex)
+        finally:
+            deadline.clear()
+
+    async def shed_connection(self, cli_sock, deadline):
+        """Send the overload response and close the connection gracefully"""
+        deadline.set(WRITE, SHED_LINGER_TIMEOUT)
+        try:
+            await cli_sock.sendall(self.overload_response)
+        except OSError as ex:
+            LOG.debug('Failed to shed connection: %r', ex)
+        else:
+            await self.linger(cli_sock, deadline)
+        finally:
+            deadline.clear()
+            await cli_sock.close()
@@ -0,0 +1,115 @@
+import sys
+
+# cache of raw header name -> interned lowercase name, bounded to avoid
+# unlimited growth by clients sending random header names
+_NAMES = {}
+_NAMES_MAX_SIZE = 1024
+
+
+def _normalize_name(name: bytes) -> str:
+    key = _NAMES.get(name)
+    if key is None:
+        key = sys.intern(name.decode('latin-1').lower())
+        if len(_NAMES) < _NAMES_MAX_SIZE:
+            _NAMES[name] = key
+    return key
+
+
+def _decode(value: bytes) -> str:
+    try:
+        return value.decode('utf-8')
+    except UnicodeDecodeError:
+        return value.decode('latin-1')
+
+
+class RequestHeaders:
+    """Compact request headers, built by parser and shared with Request
+
+    Names and values are kept as bytes and decoded on access, lookup by
+    name is case-insensitive and O(1). The read API is compatible with
+    werkzeug Headers.
+    """
+
+    __slots__ = ('_items', '_index')
+
+    def __init__(self):
+        # list of [name, value], decoded to str lazily
+        self._items = []
+        # lowercase name -> indexes of items
+        self._index = {}
+
+    def add(self, name: bytes, value: bytes):
+        key = _normalize_name(name)
+        indexes = self._index.get(key)
+        if indexes is None:
+            self._index[key] = [len(self._items)]
+        else:
+            indexes.append(len(self._items))
+        self._items.append([name, value])
+
+    def _value(self, i):
+        value = self._items[i][1]
+        if isinstance(value, bytes):
+            value = self._items[i][1] = _decode(value)
+        return value
+
+    def _name(self, i):
+        name = self._items[i][0]
+        if isinstance(name, bytes):
+            name = self._items[i][0] = name.decode('latin-1')
+        return name
+
+    def __getitem__(self, key):
+        indexes = self._index.get(key.lower())
+        if not indexes:
+            raise KeyError(key)
+        return self._value(indexes[0])
+
+    def get(self, key, default=None, type=None):
+        indexes = self._index.get(key.lower())
+        if not indexes:
+            return default
+        value = self._value(indexes[0])
+        if type is not None:
+            try:
+                value = type(value)
+            except ValueError:
+                return default
+        return value
+
+    def getlist(self, key, type=None):
+        indexes = self._index.get(key.lower(), ())
+        values = [self._value(i) for i in indexes]
+        if type is not None:
+            values = [type(x) for x in values]
+        return values
+
+    def get_all(self, key):
+        return self.getlist(key)
+
+    def __contains__(self, key):
+        return key.lower() in self._index
+
+    def __len__(self):
+        return len(self._items)
+
+    def __bool__(self):
+        return bool(self._items)
+
+    def __iter__(self):
+        return iter(self.items())
+
+    def keys(self):
+        return [self._name(i) for i in range(len(self._items))]
+
+    def values(self):
+        return [self._value(i) for i in range(len(self._items))]
+
+    def items(self):
+        return [(self._name(i), self._value(i)) for i in range(len(self._items))]
+
+    def to_wsgi_list(self):
+        return self.items()
+
+    def __repr__(self):
+        return f'{type(self).__name__}({self.items()!r})'
@@ -1,10 +1,11 @@
 import logging
+from collections import deque
 from urllib.parse import unquote
 
 import httptools
-from newio import timeout_after
 
 from ..error import (
+    HttpError,
     BadRequest,
     RequestHeaderFieldsTooLarge,
     RequestEntityTooLarge,
@@ -12,190 +13,320 @@ from ..error import (
     RequestTimeout,
 )
 from .request import RawRequest
+from .headers import RequestHeaders
+from .timer import KEEP_ALIVE, HEADER, BODY
 
 LOG = logging.getLogger(__name__)
 
 
+class HttpMessage:
+    """A request message parsed from the connection"""
+
+    def __init__(self):
+        self.method = None
+        self.url = None
+        self.version = None
+        self.headers = RequestHeaders()
+        self.keep_alive = False
+        self.body_chunks = []
+        self.completed = False
+        # reading the body failed, the rest body bytes are discarded
+        self.failed = False
+
+    def get_content_length(self):
+        value = self.headers.get('content-length')
+        if value is None:
+            return None
+        return int(value)
+
+    @property
+    def chunked(self):
+        value = self.headers.get('transfer-encoding') or ''
+        return 'chunked' in value.lower()
+
+    def take_body_chunks(self):
+        ret = b''.join(self.body_chunks)
+        self.body_chunks.clear()
+        return ret
+
+
 class RequestParser:
+    """Connection scoped request parser
+
+    The underlying httptools parser keeps running on the connection,
+    bytes received after the end of one request are parsed as the next
+    request and queued, so pipelined requests are served one by one.
+
+    Timeouts are tracked by the connection deadline instead of timeout
+    scopes, when expired the socket is shutdown and pending recv gets EOF.
+
+    Content-Length larger than max_content_length is rejected before
+    dispatch, the body size is checked by max_body_size of the request
+    when reading, which may be overridden by handlers.
+    """
 
     def __init__(self,
-                 cli_sock, cli_addr,
+                 cli_sock, cli_addr, deadline,
                  header_timeout,
                  body_timeout,
                  keep_alive_timeout,
                  max_header_size,
                  max_body_size,
+                 max_content_length,
                  header_buffer_size,
                  body_buffer_size,
                  ):
         self.cli_sock = cli_sock
         self.cli_addr = cli_addr
+        self.deadline = deadline
         self.header_timeout = header_timeout
         self.body_timeout = body_timeout
         self.keep_alive_timeout = keep_alive_timeout
         self.max_header_size = max_header_size
         self.max_body_size = max_body_size
+        self.max_content_length = max_content_length
         self.max_request_size = max_header_size + max_body_size
         self.header_buffer_size = header_buffer_size
         self.body_buffer_size = body_buffer_size
 
-        # public attrs
-        self.method = None
-        self.url = None
-        self.version = None
-        self.headers = []
-        self.remote_ip = None
-        self.protocol = None
-        self.keep_alive = False
-
         # helper attrs
         self._address = '{}:{}'.format(*self.cli_addr)
 
-        # temp attrs
+        # connection state, the receive buffer is reused by all requests
         self._parser = httptools.HttpRequestParser(self)
-        self._buffer_size = self.header_buffer_size
-        self._started = False
-        self._headers_completed = False
-        self._completed = False
+        self._buffer = memoryview(bytearray(max(header_buffer_size, body_buffer_size)))
+        self._eof = False
+        # messages which headers completed but not taken by parse()
+        self._messages = deque()
+        # the message being parsed by httptools
+        self._current = None
+        # the message returned by last parse() and it's body stream
+        self._active = None
+        self._active_body = None
+
+        # temp attrs of current message
         self._url = b''
         self._header_name = b''
-        self._body_chunks = []
-        self._readed_size = 0
+        self._header_size = 0
+
+    @property
+    def pipelined(self):
+        """Whether the next request is already received completely, so
+        it's served without waiting for the client"""
+        return bool(self._messages) and self._messages[0].completed
+
+    @property
+    def broken(self):
+        """Whether reading body of the last request failed, the rest bytes
+        of the connection can not be parsed"""
+        return self._active is not None and self._active.failed
 
     # ========= httptools callbacks ========
     def on_message_begin(self):
-        self._started = True
+        self._current = HttpMessage()
+        self._url = b''
+        self._header_name = b''
+        self._header_size = 0
 
     def on_url(self, url: bytes):
         self._url += url
+        self._header_size += len(url)
 
     def on_header(self, name: bytes, value: bytes or None):
         self._header_name += name
+        self._header_size += len(name)
         if value is not None:
-            self.headers.append((self._header_name.decode(), value.decode()))
+            self._header_size += len(value)
+            self._current.headers.add(self._header_name, value)
             self._header_name = b''
 
     def on_headers_complete(self):
-        self.method = self._parser.get_method().decode().upper()
-        self.url = unquote(self._url.decode())
-        self.version = self._parser.get_http_version()
-        self.keep_alive = self._parser.should_keep_alive()
-        if 'Content-Length' in self.headers:
-            self._content_length = int(self.headers['Content-Length'])
-        self.protocol = 'http'
-        self.remote_ip = self.cli_addr[0]
-        self._headers_completed = True
+        message = self._current
+        message.method = self._parser.get_method().decode().upper()
+        message.url = unquote(self._url.decode())
+        message.version = self._parser.get_http_version()
+        message.keep_alive = self._parser.should_keep_alive()
+        self._messages.append(message)
 
     def on_body(self, body: bytes):
-        self._body_chunks.append(body)
+        if not self._current.failed:
+            self._current.body_chunks.append(body)
 
     def on_message_complete(self):
-        self._completed = True
+        self._current.completed = True
+        self._current = None
     # ========= end httptools callbacks ========
 
-    def _get_content_length(self):
-        for name, value in self.headers:
-            if name.lower() == 'content-length':
-                return int(value)
-        raise LengthRequired()
-
-    def _feed(self, data: bytes):
-        self._readed_size += len(data)
+    def _feed(self, data: memoryview):
         return self._parser.feed_data(data)
 
-    async def _recv(self):
-        return await self.cli_sock.recv(self._buffer_size)
+    async def _recv(self, buffer_size):
+        nbytes = await self.cli_sock.recv_into(self._buffer[:buffer_size])
+        if not nbytes:
+            self._eof = True
+        return self._buffer[:nbytes]
 
-    def _take_body_chunks(self):
-        ret = b''.join(self._body_chunks)
-        self._body_chunks.clear()
-        return ret
+    def _check_header_size(self):
+        if self._current is not None and self._header_size > self.max_header_size:
+            raise RequestHeaderFieldsTooLarge()
+
+    def _body_failed(self, message, error):
+        """Mark the body as failed, the connection can not be reused"""
+        message.failed = True
+        message.body_chunks.clear()
+        return error
 
-    async def _body_stream(self):
+    def _take_body_chunks(self, message, received, max_body_size):
+        chunk = message.take_body_chunks()
+        if max_body_size is not None and received + len(chunk) > max_body_size:
+            raise self._body_failed(message, RequestEntityTooLarge())
+        return chunk
+
+    async def _body_stream(self, message, request):
         """
         Read request body
 
+        The size limit is read from request.max_body_size when reading
+        starts, so handlers can override it before reading the body.
+
         Raises:
             BadRequest: request body invalid or incomplete
             RequestTimeout: read request body timeout
+            RequestEntityTooLarge: request body too large
         """
-        self._buffer_size = self.body_buffer_size
-        if self._body_chunks:
-            yield self._take_body_chunks()
-        if self._completed:
+        max_body_size = request.max_body_size
+        content_length = message.get_content_length()
+        if max_body_size is not None and content_length is not None:
+            if content_length > max_body_size:
+                raise self._body_failed(message, RequestEntityTooLarge())
+        received = 0
+        if message.body_chunks:
+            chunk = self._take_body_chunks(message, received, max_body_size)
+            received += len(chunk)
+            yield chunk
+        if message.completed:
             return
-        async with timeout_after(self.body_timeout) as is_timeout:
+        deadline = self.deadline
+        expires = deadline.set(BODY, self.body_timeout)
+        try:
+            while not message.completed and not self._eof:
+                # the deadline may be taken by response writing when
+                # handler not read the whole body, restore it
+                if deadline.kind != BODY and not deadline.expired:
+                    deadline.set_expires(BODY, expires)
+                chunk = await self._recv(self.body_buffer_size)
+                self._feed(chunk)
+                if message.body_chunks:
+                    chunk = self._take_body_chunks(message, received, max_body_size)
+                    received += len(chunk)
+                    yield chunk
+        except httptools.HttpParserError as ex:
+            msg = 'Invalid request body from %s'
+            LOG.debug(msg, self._address, exc_info=True)
+            raise self._body_failed(message, BadRequest('Invalid request body')) from ex
+        finally:
+            deadline.clear()
+        if deadline.expired == BODY:
+            raise self._body_failed(message, RequestTimeout())
+        if not message.completed:
+            LOG.debug('Incomplete request body from %s', self._address)
+            raise self._body_failed(message, BadRequest('Incomplete request body'))
+
+    async def _drain_active(self):
+        """Consume body of previous request, the rest bytes belong to it
+
+        Returns False if the body can not be consumed, eg: too large or
+        failed to read, the connection should be closed instead of
+        responding the error, the response is already sent.
+        """
+        message = self._active
+        if message is not None and not message.completed and not message.failed:
             try:
-                while not self._completed:
-                    chunk = await self._recv()
-                    self._feed(chunk)
-                    if self._body_chunks:
-                        yield self._take_body_chunks()
-                    if not chunk:
-                        break
-            except httptools.HttpParserError as ex:
-                msg = 'Invalid request body from %s'
-                LOG.debug(msg, self._address, exc_info=True)
-                raise BadRequest('Invalid request body') from ex
-        if is_timeout:
+                async for _ in self._active_body:  # noqa: F841
+                    pass
+            except HttpError as ex:
+                LOG.info('Failed to drain request body from %s: %r', self._address, ex)
+        if message is not None and not message.completed:
+            return False
+        self._active = self._active_body = None
+        return True
+
+    async def _read_headers(self):
+        # browsers may preconnect but didn't send request immediately
+        # keep-alive connection has similar behaviors
+        deadline = self.deadline
+        if self._current is None:
+            deadline.set(KEEP_ALIVE, self.keep_alive_timeout)
+            try:
+                first_chunk = await self._recv(self.header_buffer_size)
+            finally:
+                deadline.clear()
+            if not first_chunk:
+                return False
+            self._feed(first_chunk)
+        deadline.set(HEADER, self.header_timeout)
+        try:
+            while not self._messages and not self._eof:
+                self._check_header_size()
+                chunk = await self._recv(self.header_buffer_size)
+                self._feed(chunk)
+        finally:
+            deadline.clear()
+        if deadline.expired == HEADER:
             raise RequestTimeout()
-        if not self._completed:
-            LOG.debug('Incomplete request body from %s', self._address)
-            raise BadRequest('Incomplete request body')
+        if not self._messages:
+            LOG.debug('Incomplete request headers from %s', self._address)
+            raise BadRequest('Incomplete request headers')
+        return True
 
     async def parse(self):
-        """Parse http request
+        """Parse next http request on the connection
 
         Returns:
-            Request object, or None if no data received
+            Request object, or None if no more requests on the connection
         Raises:
             BadRequest: request headers invalid or incomplete
             RequestHeaderFieldsTooLarge: request headers too large
             RequestTimeout: read request headers timeout
+            LengthRequired: request content-length missing
             RequestEntityTooLarge: request content-length too large
         """
-        # browsers may preconnect but didn't send request immediately
-        # keep-alive connection has similar behaviors
-        first_chunk = b''
-        async with timeout_after(self.keep_alive_timeout):
-            first_chunk = await self._recv()
-        if not first_chunk:
+        if not await self._drain_active():
             return None
+        if not self._messages:
+            if self._eof:
+                return None
+            try:
+                if not await self._read_headers():
+                    return None
+            except httptools.HttpParserError as ex:
+                msg = 'Invalid request headers from %s'
+                LOG.debug(msg, self._address, exc_info=True)
+                raise BadRequest('Invalid request headers') from ex
+        message = self._messages.popleft()
 
-        # read request headers
-        try:
-            self._feed(first_chunk)
-            async with timeout_after(self.header_timeout) as is_timeout:
-                while not self._headers_completed:
-                    if self._readed_size > self.max_header_size:
-                        raise RequestHeaderFieldsTooLarge()
-                    chunk = await self._recv()
-                    self._feed(chunk)
-                    if not chunk:
-                        break
-        except httptools.HttpParserError as ex:
-            msg = 'Invalid request headers from %s'
-            LOG.debug(msg, self._address, exc_info=True)
-            raise BadRequest('Invalid request headers') from ex
-        if is_timeout:
-            raise RequestTimeout()
-        if not self._headers_completed:
-            LOG.debug('Incomplete request headers from %s', self._address)
-            raise BadRequest('Incomplete request headers')
-
-        # check content-length
-        if self.method in ['POST', 'PUT', 'PATCH']:
-            content_length = self._get_content_length()
-            if content_length > self.max_body_size:
+        content_length = message.get_content_length()
+        if message.method in ['POST', 'PUT', 'PATCH']:
+            if content_length is None and not message.chunked:
+                raise LengthRequired()
+        # reject before dispatch, limits overridden by handlers and chunked
+        # body are checked when reading the body
+        if self.max_content_length is not None and content_length is not None:
+            if content_length > self.max_content_length:
                 raise RequestEntityTooLarge()
 
-        return RawRequest(
-            method=self.method,
-            url=self.url,
-            version=self.version,
-            headers=self.headers,
-            body=self._body_stream(),
-            remote_ip=self.remote_ip,
-            protocol=self.protocol,
-            keep_alive=self.keep_alive,
+        request = RawRequest(
+            method=message.method,
+            url=message.url,
+            version=message.version,
+            headers=message.headers,
+            body=None,
+            remote_ip=self.cli_addr[0],
+            protocol='http',
+            keep_alive=message.keep_alive,
+            max_body_size=self.max_body_size,
         )
+        request.body = self._body_stream(message, request)
+        self._active = message
+        self._active_body = request.body
+        return request
@@ -5,6 +5,7 @@ class RawRequest:
         headers, body,
         protocol, remote_ip,
         keep_alive,
+        max_body_size=None,
     ):
         self.method = method
         self.url = url
@@ -14,6 +15,8 @@ class RawRequest:
         self.protocol = protocol
         self.remote_ip = remote_ip
         self.keep_alive = keep_alive
+        # None means unlimited
+        self.max_body_size = max_body_size
 
     def __repr__(self):
         return f'<{type(self).__name__} {self.method} {self.url}>'
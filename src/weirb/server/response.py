@@ -1,3 +1,5 @@
+import io
+import os
 from typing import List, Tuple, AsyncIterable, Any
 from zope.interface import Interface, Attribute, implementer
 
@@ -34,3 +36,73 @@ class ErrorResponse(AbstractResponse):
 
     def __repr__(self):
         return f'<{type(self).__name__} {self.status} {self.status_text}>'
+
+
+class FileBody:
+    """Response body of a file, server will send it by sendfile if possible
+
+    Args:
+        file: file object opened in binary mode, or path of the file
+        offset: start position to send
+        count: number of bytes to send, default to end of the file
+        chunk_size: chunk size when sendfile not possible
+    """
+
+    def __init__(self, file, offset=0, count=None, chunk_size=64 * 1024):
+        self._owned = isinstance(file, (str, os.PathLike))
+        if self._owned:
+            file = open(file, 'rb')
+        self.file = file
+        self.offset = offset
+        if count is None:
+            count = max(self._get_file_size() - offset, 0)
+        self.count = count
+        self.chunk_size = chunk_size
+
+    def __repr__(self):
+        name = getattr(self.file, 'name', None) or type(self.file).__name__
+        return f'<{type(self).__name__} {name!r} {self.offset}+{self.count}>'
+
+    def __len__(self):
+        return self.count
+
+    def _get_file_size(self):
+        try:
+            return os.fstat(self.file.fileno()).st_size
+        except (AttributeError, io.UnsupportedOperation):
+            pass
+        position = self.file.tell()
+        try:
+            return self.file.seek(0, io.SEEK_END)
+        finally:
+            self.file.seek(position)
+
+    def fileno(self):
+        """File descriptor for sendfile, or None if not a regular file"""
+        try:
+            return self.file.fileno()
+        except (AttributeError, io.UnsupportedOperation):
+            return None
+
+    async def read_chunks(self, offset=None, count=None):
+        """Read file by chunks, from offset and at most count bytes"""
+        offset = self.offset if offset is None else offset
+        remain = self.count if count is None else count
+        self.file.seek(offset)
+        while remain > 0:
+            chunk = self.file.read(min(self.chunk_size, remain))
+            if not chunk:
+                break
+            remain -= len(chunk)
+            yield chunk
+
+    async def __aiter__(self):
+        try:
+            async for chunk in self.read_chunks():
+                yield chunk
+        finally:
+            self.close()
+
+    def close(self):
+        if self._owned:
+            self.file.close()
@@ -6,25 +6,34 @@ async with app.context() as ctx:
     async for chunk in response.body:
         # (2) send response body to socket
 """
+import gc
 import os
 import sys
+import time
 import fcntl
+import signal
 import logging
 
-from newio import socket, open_nursery, Runner
+from newio import socket, open_nursery, sleep, Runner
 from gunicorn.reloader import Reloader
 
 from .parser import RequestParser
 from .worker import Worker
+from .timer import TimerWheel
+from .admission import Admission
 
 __all__ = ("serve",)
 
 
 LOG = logging.getLogger(__name__)
 
+MASTER_SIGNALS = (signal.SIGINT, signal.SIGTERM, signal.SIGQUIT, signal.SIGHUP)
+WORKER_RESPAWN_INTERVAL = 1
+
 
 def serve(app, config):
     server = Server(app, config)
+    app.server = server
     server.start()
 
 
@@ -33,24 +42,32 @@ class Server:
         self.app = app
         self.config = config
         self.debug = config.debug
-        self._runner = Runner(monitor=self.config.newio_monitor_enable)
         self._pid = os.getpid()
+        self.admission = Admission(
+            max_connections=config.max_connections,
+            max_requests=config.max_requests,
+            retry_after=config.overload_retry_after,
+        )
         self._init_serv_sock()
         self._reloading = False
+        self._stopping = False
+        # pid -> start time of worker processes, only used in prefork mode
+        self._worker_processes = {}
 
-    def _parse_request(self, cli_sock, cli_addr):
-        parser = RequestParser(
+    def _create_parser(self, cli_sock, cli_addr, deadline):
+        return RequestParser(
             cli_sock,
             cli_addr,
+            deadline,
             header_timeout=self.config.request_header_timeout,
             body_timeout=self.config.request_body_timeout,
             keep_alive_timeout=self.config.request_keep_alive_timeout,
             max_header_size=self.config.request_max_header_size,
             max_body_size=self.config.request_max_body_size,
+            max_content_length=self.app.max_content_length,
             header_buffer_size=self.config.request_header_buffer_size,
             body_buffer_size=self.config.request_body_buffer_size,
         )
-        return parser.parse()
 
     def _init_serv_sock(self):
         host = self.config.host
@@ -86,20 +103,131 @@ class Server:
             return
         print(f"* Detected change in {filename!r}, reloading")
         self._reloading = True
+        self._kill_worker_processes(signal.SIGTERM)
         os.execv(sys.executable, [sys.executable] + sys.argv)
 
     def start(self):
         self._start_reloader()
+        if self.config.workers > 1:
+            self._start_prefork()
+        else:
+            self._run(monitor=self.config.newio_monitor_enable)
+
+    def _run(self, monitor=False):
+        runner = Runner(monitor=monitor)
         try:
-            self._runner(self._serve_forever())
+            runner(self._serve_forever())
         except KeyboardInterrupt:
-            print(f"* Server PID={self._pid} stopped")
+            print(f"* Server PID={os.getpid()} stopped")
+
+    def _start_prefork(self):
+        """Master process: fork workers which share the listening socket"""
+        # the app is already imported and initialized, move everything
+        # allocated so far to the permanent generation, so GC in workers
+        # will not touch these pages and break copy-on-write
+        gc.collect()
+        if hasattr(gc, "freeze"):
+            gc.freeze()
+        for signum in MASTER_SIGNALS:
+            signal.signal(signum, self._handle_master_signal)
+        for __ in range(self.config.workers):
+            self._spawn_worker_process()
+        self._wait_worker_processes()
+        print(f"* Server PID={self._pid} stopped")
+
+    def _spawn_worker_process(self):
+        pid = os.fork()
+        if pid != 0:
+            self._worker_processes[pid] = time.monotonic()
+            return
+        # worker process
+        exit_code = 0
+        try:
+            for signum in MASTER_SIGNALS:
+                signal.signal(signum, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.default_int_handler)
+            print(f"* Worker PID={os.getpid()} started")
+            self._run()
+        except BaseException:
+            LOG.exception("Worker PID=%s crashed", os.getpid())
+            exit_code = 1
+        finally:
+            os._exit(exit_code)
+
+    def _wait_worker_processes(self):
+        while self._worker_processes:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            started = self._worker_processes.pop(pid, None)
+            if started is None or self._stopping:
+                continue
+            LOG.warning("Worker PID=%s exited with status %s, restarting", pid, status)
+            # avoid fork bomb when workers crash immediately after started
+            if time.monotonic() - started < WORKER_RESPAWN_INTERVAL:
+                time.sleep(WORKER_RESPAWN_INTERVAL)
+            if not self._stopping:
+                self._spawn_worker_process()
+
+    def _handle_master_signal(self, signum, frame):
+        if signum == signal.SIGHUP:
+            # restart all workers, they will be respawned by master
+            print(f"* Server PID={self._pid} restarting workers")
+            self._kill_worker_processes(signal.SIGTERM)
+            return
+        self._stopping = True
+        self._kill_worker_processes(signum)
+
+    def _kill_worker_processes(self, signum):
+        for pid in list(self._worker_processes):
+            try:
+                os.kill(pid, signum)
+            except ProcessLookupError:
+                pass
+
+    async def _expire_deadlines(self, timer_wheel):
+        """Reap connections past their deadlines in batches"""
+        while True:
+            await sleep(timer_wheel.granularity)
+            num_expired = timer_wheel.expire()
+            if num_expired:
+                LOG.debug("%s connections deadline expired", num_expired)
+
+    async def _shed_connection(self, cli_sock, cli_addr, deadline):
+        LOG.info("Server overloaded, shed connection from {}:{}".format(*cli_addr))
+        await self.admission.shed_connection(cli_sock, deadline)
+
+    def _accept_pending(self):
+        """Accept pending connections without waiting"""
+        try:
+            cli_sock, cli_addr = self._serv_sock.socket.accept()
+        except (BlockingIOError, InterruptedError):
+            return None, None
+        return type(self._serv_sock)(cli_sock), cli_addr
 
     async def _serve_forever(self):
+        # created in each worker process, deadlines are process local
+        timer_wheel = TimerWheel(self.config.timer_granularity)
+        accept_batch_size = self.config.accept_batch_size
         async with self._serv_sock:
             async with open_nursery() as nursery:
+                await nursery.spawn(self._expire_deadlines(timer_wheel))
                 while True:
                     cli_sock, cli_addr = await self._serv_sock.accept()
-                    LOG.debug("Accept connection from {}:{}".format(*cli_addr))
-                    worker = Worker(self.app, self._parse_request, cli_sock, cli_addr)
-                    await nursery.spawn(worker.main(nursery))
+                    # drain several pending accepts per wakeup
+                    for index in range(accept_batch_size):
+                        if index:
+                            cli_sock, cli_addr = self._accept_pending()
+                            if cli_sock is None:
+                                break
+                        LOG.debug("Accept connection from {}:{}".format(*cli_addr))
+                        deadline = timer_wheel.deadline(cli_sock)
+                        if not self.admission.admit_connection():
+                            await nursery.spawn(
+                                self._shed_connection(cli_sock, cli_addr, deadline))
+                        else:
+                            parser = self._create_parser(cli_sock, cli_addr, deadline)
+                            worker = Worker(self.app, parser, cli_sock, cli_addr,
+                                            deadline, self.admission)
+                            await nursery.spawn(worker.main())
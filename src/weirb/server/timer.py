@@ -0,0 +1,128 @@
+import time
+import socket
+import logging
+
+LOG = logging.getLogger(__name__)
+
+KEEP_ALIVE = 'keep-alive'
+HEADER = 'header'
+BODY = 'body'
+WRITE = 'write'
+
+
+class Deadline:
+    """Deadline of a connection, tracked by the server-wide TimerWheel
+
+    Only one deadline is active at a time. Updating the deadline is just
+    assigning attributes, the wheel entry is rescheduled lazily when its
+    slot comes. When expired, the socket is shutdown so the pending recv
+    returns EOF (or send fails), then the connection checks `expired`.
+    """
+
+    __slots__ = ('_wheel', '_sock', '_scheduled_tick', 'kind', 'expires', 'expired')
+
+    def __init__(self, wheel, sock):
+        self._wheel = wheel
+        self._sock = sock
+        self._scheduled_tick = None
+        self.kind = None
+        self.expires = None
+        self.expired = None
+
+    def __repr__(self):
+        return f'<{type(self).__name__} {self.kind} {self.expires}>'
+
+    def set(self, kind, timeout):
+        """Set deadline after timeout seconds, negative timeout means never
+
+        Returns:
+            expire time of the deadline, or None if never
+        """
+        if timeout < 0:
+            self.clear()
+            return None
+        expires = time.monotonic() + timeout
+        self.set_expires(kind, expires)
+        return expires
+
+    def set_expires(self, kind, expires):
+        """Set deadline at monotonic time expires, None means never"""
+        if expires is None:
+            self.clear()
+            return
+        self.kind = kind
+        self.expires = expires
+        tick = self._wheel.tick_of(expires)
+        if self._scheduled_tick is None or tick < self._scheduled_tick:
+            self._wheel.schedule(self, tick)
+
+    def clear(self):
+        self.kind = None
+        self.expires = None
+
+    def expire(self):
+        LOG.debug('Connection %s deadline expired', self.kind)
+        self.expired = self.kind
+        how = socket.SHUT_RDWR if self.kind == WRITE else socket.SHUT_RD
+        self.clear()
+        try:
+            self._sock.socket.shutdown(how)
+        except OSError:
+            pass  # already disconnected
+
+
+class TimerWheel:
+    """Hashed timer wheel with coarse granularity
+
+    Cost of scheduling and expiring is O(1) per deadline, the periodic
+    tick only visits deadlines in due slots, so overhead does not grow
+    with number of idle connections.
+    """
+
+    def __init__(self, granularity=1.0, num_slots=512):
+        self.granularity = granularity
+        self._slots = [[] for __ in range(num_slots)]
+        self._current_tick = self.tick_of(time.monotonic()) - 1
+
+    def tick_of(self, timestamp):
+        # round up, never expire earlier than the deadline
+        return int(timestamp / self.granularity) + 1
+
+    def deadline(self, sock):
+        return Deadline(self, sock)
+
+    def schedule(self, deadline, tick):
+        # past deadlines expire on next tick
+        tick = max(tick, self._current_tick + 1)
+        deadline._scheduled_tick = tick
+        self._slots[tick % len(self._slots)].append(deadline)
+
+    def expire(self, now=None):
+        """Expire all due deadlines, returns number of expired"""
+        if now is None:
+            now = time.monotonic()
+        num_expired = 0
+        now_tick = int(now / self.granularity)
+        while self._current_tick < now_tick:
+            self._current_tick += 1
+            tick = self._current_tick
+            index = tick % len(self._slots)
+            due, self._slots[index] = self._slots[index], []
+            for deadline in due:
+                scheduled_tick = deadline._scheduled_tick
+                if scheduled_tick != tick:
+                    # keep deadlines of later rounds, drop stale entries
+                    # which already rescheduled to another tick
+                    if scheduled_tick is not None and scheduled_tick > tick:
+                        if scheduled_tick % len(self._slots) == index:
+                            self._slots[index].append(deadline)
+                    continue
+                deadline._scheduled_tick = None
+                if deadline.expires is None:
+                    continue  # cleared
+                if deadline.expires > now:
+                    self.schedule(deadline, self.tick_of(deadline.expires))
+                else:
+                    deadline.expire()
+                    num_expired += 1
+        return num_expired
@@ -1,11 +1,23 @@
+import os
+import errno
 import logging
-from newio import CancelledError
+from newio import CancelledError, wait_write
 
 from ..error import InternalServerError, HttpError
-from .response import ErrorResponse
+from .response import ErrorResponse, FileBody
+from .timer import WRITE
 
 LOG = logging.getLogger(__name__)
 
+try:
+    IOV_MAX = os.sysconf('SC_IOV_MAX')
+except (AttributeError, ValueError, OSError):
+    IOV_MAX = 1024
+# sendfile not supported by the file or socket, fallback to read file
+SENDFILE_UNSUPPORTED = {errno.EINVAL, errno.ENOSYS, errno.ENOTSOCK, errno.EOPNOTSUPP}
+CHUNK_END = b'\r\n'
+LAST_CHUNK = b'0\r\n\r\n'
+
 
 def _is_keep_alive(request, response):
     keep_alive = response.keep_alive
@@ -21,50 +33,138 @@ def _format_headers(response):
     return '\r\n'.join(headers).encode() + b'\r\n\r\n'
 
 
-def _format_chunk(chunk: bytes):
-    length = hex(len(chunk))[2:].encode()
-    return length + b'\r\n' + chunk + b'\r\n'
+def _format_chunk_size(chunk: bytes):
+    return b'%x\r\n' % len(chunk)
 
 
 class Worker:
-    def __init__(self, app, parse_request, cli_sock, cli_addr):
+    def __init__(self, app, parser, cli_sock, cli_addr, deadline, admission):
         self.app = app
-        self.parse_request = parse_request
+        self.parser = parser
         self.cli_sock = cli_sock
         self.cli_addr = cli_addr
+        self.deadline = deadline
+        self.admission = admission
         self.address = '{}:{}'.format(*cli_addr)
+        self.flush_threshold = app.config.response_flush_threshold
+        self.write_timeout = app.config.response_write_timeout
+        # buffers waiting to be sent by one sendmsg call
+        self._output = []
+        self._output_size = 0
 
     def __repr__(self):
         return f'<Worker {self.address} at {hex(id(self))}>'
 
-    async def main(self, nursery):
+    async def main(self):
         try:
-            keep_alive = await self._worker()
-            if not keep_alive:
-                await self._close()
-            else:
-                await nursery.spawn(self.main(nursery))
+            while True:
+                keep_alive = await self._worker()
+                # the next request is received completely, delay flush to
+                # coalesce responses into fewer writes, otherwise flush
+                # before waiting for the client
+                if not keep_alive or not self.parser.pipelined:
+                    await self._flush()
+                if not keep_alive:
+                    break
         except CancelledError:
             LOG.info(f'Worker {self} cancelled')
-            await self._close()
+        except OSError as ex:
+            if self.deadline.expired == WRITE:
+                LOG.info('Write response to %s timeout', self.address)
+            else:
+                LOG.exception(ex)
         except Exception as ex:
             LOG.exception(ex)
+        finally:
             await self._close()
-        except BaseException:
-            await self._close()
-            raise
+            self.admission.release_connection()
+
+    async def _write(self, *buffers):
+        for data in buffers:
+            self._output.append(data)
+            self._output_size += len(data)
+        if self._output_size >= self.flush_threshold:
+            await self._flush()
+
+    async def _flush(self):
+        """Send buffered data with vectored writes, without concatenation"""
+        buffers = self._output
+        if not buffers:
+            return
+        self._output = []
+        self._output_size = 0
+        self.deadline.set(WRITE, self.write_timeout)
+        try:
+            while buffers:
+                sent = await self.cli_sock.sendmsg(buffers[:IOV_MAX])
+                index = 0
+                while index < len(buffers) and sent >= len(buffers[index]):
+                    sent -= len(buffers[index])
+                    index += 1
+                buffers = buffers[index:]
+                if sent:
+                    buffers[0] = memoryview(buffers[0])[sent:]
+        finally:
+            self.deadline.clear()
+
+    async def _sendfile(self, body: FileBody):
+        """Send file by os.sendfile, fallback to chunked reads"""
+        await self._flush()
+        offset = body.offset
+        remain = body.count
+        fileno = body.fileno()
+        sock_fileno = self.cli_sock.fileno()
+        self.deadline.set(WRITE, self.write_timeout)
+        try:
+            while fileno is not None and remain > 0:
+                try:
+                    sent = os.sendfile(sock_fileno, fileno, offset, remain)
+                except BlockingIOError:
+                    await wait_write(sock_fileno)
+                    continue
+                except OSError as ex:
+                    if ex.errno not in SENDFILE_UNSUPPORTED:
+                        raise
+                    LOG.debug('sendfile not supported for %r: %s', body, ex)
+                    break
+                if sent == 0:
+                    raise RuntimeError(f'file {body!r} truncated when sending')
+                offset += sent
+                remain -= sent
+        finally:
+            self.deadline.clear()
+        if remain > 0:
+            async for chunk in body.read_chunks(offset, remain):
+                await self._write(chunk)
 
     async def _send_response(self, response):
         headers = _format_headers(response)
-        await self.cli_sock.sendall(headers)
+        await self._write(headers)
+        if isinstance(response.body, FileBody) and not response.chunked:
+            try:
+                await self._sendfile(response.body)
+            finally:
+                response.body.close()
+        else:
+            try:
+                await self._send_body(response)
+            finally:
+                # release resources held by the body at once if write failed,
+                # eg: bulkheads of streaming methods
+                aclose = getattr(response.body, 'aclose', None)
+                if aclose is not None:
+                    await aclose()
+
+    async def _send_body(self, response):
         if response.chunked:
             async for chunk in response.body:
-                chunk = _format_chunk(chunk)
-                await self.cli_sock.sendall(chunk)
-            await self.cli_sock.sendall(b'0\r\n\r\n')
+                # empty chunk means end of body, skip it
+                if chunk:
+                    await self._write(_format_chunk_size(chunk), chunk, CHUNK_END)
+            await self._write(LAST_CHUNK)
         else:
             async for chunk in response.body:
-                await self.cli_sock.sendall(chunk)
+                await self._write(chunk)
 
     async def _send_error(self, error: HttpError):
         response = ErrorResponse(error)
@@ -73,16 +173,24 @@ class Worker:
 
     async def _close(self):
         LOG.debug('Close connection %s', self.address)
+        self.deadline.clear()
         await self.cli_sock.close()
 
     async def _drain_request(self, request):
-        async for _ in request.body:  # noqa: F841
-            pass
+        """Returns False if the body can not be drained, eg: too large"""
+        try:
+            async for _ in request.body:  # noqa: F841
+                pass
+        except HttpError as ex:
+            LOG.info('Failed to drain request body from %s: %r', self.address, ex)
+            return False
+        # reading the body already failed in the handler
+        return not self.parser.broken
 
     async def _worker(self):
         # parse request
         try:
-            request = await self.parse_request(self.cli_sock, self.cli_addr)
+            request = await self.parser.parse()
         except HttpError as ex:
             LOG.info('Failed to parse request from %s', self.address)
             await self._send_error(ex)
@@ -90,20 +198,30 @@ class Worker:
         if request is None:
             return False
         LOG.debug('Request parsed: %s', request)
+        if not self.admission.admit_request():
+            LOG.info('Server overloaded, shed request from %s', self.address)
+            await self._write(self.admission.overload_response)
+            await self._flush()
+            await self.admission.linger(self.cli_sock, self.deadline)
+            return False
+        try:
+            return await self._handle_request(request)
+        finally:
+            self.admission.release_request()
 
-        # handle request
+    async def _handle_request(self, request):
         async with self.app.context() as ctx:
             try:
                 response = await ctx(request)
             except HttpError as ex:
-                await self._drain_request(request)
+                drained = await self._drain_request(request)
                 await self._send_error(ex)
-                return request.keep_alive
+                return drained and request.keep_alive
             except Exception as ex:
                 LOG.error('Error raised when handle request:', exc_info=ex)
-                await self._drain_request(request)
+                drained = await self._drain_request(request)
                 await self._send_error(InternalServerError())
-                return request.keep_alive
+                return drained and request.keep_alive
             keep_alive = _is_keep_alive(request, response)
             await self._send_response(response)
         LOG.debug('Request finished: %s', response)
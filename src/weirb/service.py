@@ -1,17 +1,36 @@
+import math
+import random
 import inspect
 import logging
 import itertools
 from functools import partial
 
+from newio import open_nursery, timeout_after
 from validr import T, Invalid
 
 from .response import Response
+from .cache import ResultCache, SingleFlight
+from .bulkhead import Bulkhead
+from .offload import OFFLOAD_KINDS
+from .compat.contextlib import AsyncExitStack
+from .encoder import compile_json_encoder
+from .jsoncodec import StdlibJsonCodec
 from .helper import HTTP_METHODS
 from .tagger import tagger
-from .error import ServiceError, ServiceInvalidParams
+from .error import (
+    HttpError,
+    ServiceError,
+    ServiceInvalidParams,
+    ServiceTimeout,
+    BadRequest,
+    NotFound,
+    InternalServerError,
+)
 
 LOG = logging.getLogger(__name__)
 
+NDJSON_MIMETYPE = "application/x-ndjson"
+
 
 class Route:
     def __init__(self, path, methods):
@@ -55,6 +74,171 @@ def raises(*errors):
 get_raises = tagger.get("raises", default=None)
 
 
+_NOT_SET = object()
+
+
+def max_body_size(size):
+    """Override request_max_body_size of the handler, None means unlimited"""
+    if size is not None and size < 0:
+        raise ValueError("max_body_size should be None or >= 0")
+    return tagger.tag("max_body_size", size)
+
+
+get_max_body_size = tagger.get("max_body_size", default=_NOT_SET)
+
+
+def max_timeout(seconds):
+    """Override handler_max_timeout of the handler, None means unlimited
+
+    The handler is cancelled and Service.Timeout is returned when either
+    the max timeout or the request timeout header is exceeded.
+    """
+    if seconds is not None and seconds < 0:
+        raise ValueError("max_timeout should be None or >= 0")
+    return tagger.tag("max_timeout", seconds)
+
+
+get_max_timeout = tagger.get("max_timeout", default=_NOT_SET)
+
+
+RETURNS_VALIDATION_MODES = {"always", "never", "sample"}
+
+
+def validate_returns(mode, sample_rate=None):
+    """Override returns validation of the handler
+
+    Args:
+        mode: always, never or sample
+        sample_rate: probability to validate in sample mode, default to
+            config returns_validation_sample_rate
+    """
+    if mode not in RETURNS_VALIDATION_MODES:
+        raise ValueError(f"unknown returns validation mode {mode!r}")
+    if sample_rate is not None and not 0 <= sample_rate <= 1:
+        raise ValueError("sample_rate should between 0 and 1")
+    return tagger.tag("returns_validation", (mode, sample_rate))
+
+
+get_returns_validation = tagger.get("returns_validation", default=(None, None))
+
+
+def cached(ttl=None, maxsize=1024):
+    """Cache results of the RPC method, keyed on validated params
+
+    The serialized JSON result is cached, so cache hits skip both the
+    handler and JSON encoding. Only for methods whose result depends on
+    params only, service errors are not cached.
+
+    The cache is available as `get_cache(f)` for metrics and explicit
+    invalidation.
+    """
+    return tagger.tag("cached", ResultCache(ttl=ttl, maxsize=maxsize))
+
+
+get_cache = tagger.get("cached", default=None)
+
+
+def single_flight():
+    """Coalesce concurrent calls of the RPC method with equal params
+
+    Concurrent calls share one in-flight execution, waiters get the same
+    result or service error. Handler changes on response other than the
+    result are not shared. `get_single_flight(f)` reports the coalescing.
+    """
+    return tagger.tag("single_flight", SingleFlight())
+
+
+get_single_flight = tagger.get("single_flight", default=None)
+
+
+def concurrency_limit(max_concurrency, max_queue=0, queue_timeout=None):
+    """Limit concurrent calls of the handler, or the service if decorate
+    the service class, overrides config service_max_concurrency
+
+    Calls exceeding the limit wait in a FIFO queue, when the queue is full
+    or waited more than queue_timeout seconds, 503 is returned. Cache hits
+    and coalesced calls don't take the slots.
+
+    Args:
+        max_concurrency: max number of concurrent calls
+        max_queue: max number of waiting calls, 0 means no waiting
+        queue_timeout: max seconds to wait, None means no timeout
+    """
+    if max_concurrency <= 0:
+        raise ValueError("max_concurrency should be > 0")
+    if max_queue < 0:
+        raise ValueError("max_queue should be >= 0")
+    if queue_timeout is not None and queue_timeout < 0:
+        raise ValueError("queue_timeout should be None or >= 0")
+    return tagger.tag("concurrency_limit", (max_concurrency, max_queue, queue_timeout))
+
+
+get_concurrency_limit = tagger.get("concurrency_limit", default=None)
+
+
+def offload(kind="thread"):
+    """Run the blocking handler in the bounded thread or process pool
+
+    The handler should be a plain function instead of coroutine function.
+    Process handlers are called with self of None, because the service
+    instance can not be pickled, params and result should be picklable.
+    """
+    if kind not in OFFLOAD_KINDS:
+        raise ValueError(f"unknown offload kind {kind!r}")
+    return tagger.tag("offload", kind)
+
+
+get_offload = tagger.get("offload", default=None)
+
+
+def _set_response_error(response, ex, use_msgpack=False):
+    response.status = ex.status
+    response.headers["Service-Error"] = ex.code
+    data = dict(message=ex.message, data=ex.data)
+    if use_msgpack:
+        response.msgpack(data)
+    else:
+        response.json(data)
+
+
+def _load_request_timeout(context, request):
+    """Set context deadline by the request timeout header"""
+    header = context.config.request_timeout_header
+    value = request.headers.get(header)
+    if value is None:
+        return
+    try:
+        timeout = float(value)
+    except ValueError:
+        timeout = None
+    if timeout is None or not math.isfinite(timeout):
+        LOG.warning(f"Invalid {header} header {value!r}")
+        return
+    if timeout >= 0:
+        context.set_timeout(timeout)
+
+
+def _format_error_entry(ex):
+    """Error entry of batch results and streaming lines"""
+    if isinstance(ex, ServiceError):
+        return dict(error=ex.code, message=ex.message, data=ex.data)
+    if not isinstance(ex, HttpError):
+        ex = InternalServerError()
+    return dict(error=ex.status, message=ex.message)
+
+
+def _use_msgpack(context, request):
+    """Whether to return MessagePack, negotiated by Accept header"""
+    return context.msgpack_codec is not None and request.accept_msgpack
+
+
+async def _read_request_data(request):
+    """Read RPC request data, MessagePack or JSON"""
+    if request.is_msgpack:
+        return await request.msgpack()
+    return await request.json()
+
+
 class Service:
     def __init__(self, app, cls):
         self.app = app
@@ -62,12 +246,25 @@ class Service:
         self.scope = app.create_scope(cls)
         self.name = cls.__name__[: -len("Service")]
         self.doc = cls.__doc__
+        self.bulkhead = self._load_bulkhead(app.config)
         self._load_handlers()
 
     def __repr__(self):
         handlers = ", ".join(h.name for h in self.handlers)
         return f"<Service {self.name}: {handlers}>"
 
+    def _load_bulkhead(self, config):
+        limit = get_concurrency_limit(self.cls)
+        if limit is None:
+            if not config.service_max_concurrency:
+                return None
+            limit = (
+                config.service_max_concurrency,
+                config.service_max_queue,
+                config.service_queue_timeout,
+            )
+        return Bulkhead(self.name, *limit)
+
     def _load_handlers(self):
         self.handlers = []
         for name, f in vars(self.cls).items():
@@ -85,13 +282,21 @@ class Service:
         return name.startswith("do_") and name != "do_"
 
     def _load_handler(self, name, f, is_method):
-        self._check_handler_func(name, f)
+        self._check_handler_func(name, f, is_method)
         handler = Handler(self, name, f, is_method)
         self.handlers.append(handler)
 
-    def _check_handler_func(self, name, f):
+    def _check_handler_func(self, name, f, is_method):
         class_name = self.cls.__name__
-        if not inspect.iscoroutinefunction(f):
+        is_async = inspect.iscoroutinefunction(f) or inspect.isasyncgenfunction(f)
+        if get_offload(f) is not None:
+            if is_async:
+                msg = f"{class_name}.{name} is async function, can not be offloaded"
+                raise TypeError(msg)
+        elif is_method and inspect.isasyncgenfunction(f):
+            # streaming RPC method
+            pass
+        elif not inspect.iscoroutinefunction(f):
             msg = f"{class_name}.{name} is not coroutine function"
             raise TypeError(msg)
 
@@ -102,6 +307,7 @@ class Handler:
         self.name = name
         self.f = f
         self.is_method = is_method
+        self.is_stream = is_method and inspect.isasyncgenfunction(f)
         self.scope = service.scope
         self.service_name = service.name
         self.decorators = service.app.decorators
@@ -115,13 +321,82 @@ class Handler:
             self.params = self._get_params(f)
         self.returns = self._get_returns(f)
         self.raises = self._get_raises(f)
+        self.max_body_size = get_max_body_size(f)
+        self.max_timeout = get_max_timeout(f)
+        if self.max_timeout is _NOT_SET:
+            self.max_timeout = service.app.config.handler_max_timeout
+        self.cache = get_cache(f)
+        if self.cache is not None and not self.is_method:
+            msg = f"{service.cls.__name__}.{name} is not RPC method, can not be cached"
+            raise TypeError(msg)
+        self.single_flight = get_single_flight(f)
+        if self.single_flight is not None and not self.is_method:
+            msg = (f"{service.cls.__name__}.{name} is not RPC method, "
+                   "can not be single flight")
+            raise TypeError(msg)
+        coalesced = self.cache is not None or self.single_flight is not None
+        if self.is_stream and coalesced:
+            msg = (f"{service.cls.__name__}.{name} is streaming, "
+                   "can not be cached or single flight")
+            raise TypeError(msg)
+        config = service.app.config
+        self.stream_flush_items = config.stream_flush_items
+        self.stream_flush_size = config.stream_flush_size
         self.params_validator = None
         if self.params is not None:
             self.params_validator = self._compile_schema(self.params)
         self.returns_validator = None
         if self.returns is not None:
             self.returns_validator = self._compile_schema(self.returns)
+        self._load_returns_validation(f, service.app.config)
+        self.returns_encoder = self._compile_returns_encoder(service.app)
+        self.returns_item_encoder = self._compile_returns_item_encoder(service.app)
+        # content of cache and single flight should be bytes
+        self.json_incremental = self.cache is None and self.single_flight is None
+        self.bulkheads = self._load_bulkheads(f)
+        self.offload = get_offload(f)
         self.handler = self._decorate(f)
+        if self.cache is not None:
+            self.cache.bind(self.params_validator)
+
+    def _load_returns_validation(self, f, config):
+        mode, sample_rate = get_returns_validation(f)
+        if mode is None:
+            mode = config.returns_validation
+        if sample_rate is None:
+            sample_rate = config.returns_validation_sample_rate
+        self.returns_validation = mode
+        self.returns_sample_rate = sample_rate
+        self.returns_metrics = dict(validated=0, skipped=0, invalid=0)
+
+    def _load_bulkheads(self, f):
+        """Bulkheads of the handler and the service, acquired in order"""
+        bulkheads = []
+        limit = get_concurrency_limit(f)
+        if limit is not None:
+            bulkheads.append(Bulkhead(f"{self.service_name}.{self.name}", *limit))
+        if self.service.bulkhead is not None:
+            bulkheads.append(self.service.bulkhead)
+        return bulkheads
+
+    def _compile_returns_encoder(self, app):
+        """Precompiled JSON encoder of returns, None if not available"""
+        config = app.config
+        if self.returns is None or not config.json_precompile_enable:
+            return None
+        # the codec handles pretty print, other backends are fast enough
+        if config.json_pretty or type(app.json_codec) is not StdlibJsonCodec:
+            return None
+        return compile_json_encoder(self.returns, sort_keys=config.json_sort_keys)
+
+    def _compile_returns_item_encoder(self, app):
+        """Precompiled JSON encoder of list items, for incremental encoding"""
+        if self.returns_encoder is None or self.is_stream:
+            return None
+        if self.returns.validator != "list" or self.returns.items is None:
+            return None
+        sort_keys = app.config.json_sort_keys
+        return compile_json_encoder(self.returns.items, sort_keys=sort_keys)
 
     def _load_routes(self):
         if self.is_method:
@@ -164,8 +439,32 @@ class Handler:
     def _compile_schema(self, schema):
         return self.schema_compiler.compile(schema)
 
+    def _offload(self, f):
+        """Wrap the blocking function as coroutine function"""
+        pool = self.service.app.offload_pools[self.offload]
+        is_process = self.offload == "process"
+
+        async def offloaded(service, **params):
+            if is_process:
+                service = None
+            return await pool.run(f, service, **params)
+
+        return offloaded
+
+    def _open_stream(self, f):
+        """Wrap the async generator function as coroutine function which
+        returns the async generator, so decorators run before streaming"""
+        async def open_stream(service, **params):
+            return f(service, **params)
+
+        return open_stream
+
     def _decorate(self, f):
         origin = f
+        if self.offload is not None:
+            f = self._offload(f)
+        if self.is_stream:
+            f = self._open_stream(f)
         for d in reversed(self.decorators):
             f = d(f, self)
         f.__name__ = origin.__name__
@@ -174,43 +473,333 @@ class Handler:
         f.__doc__ = origin.__doc__
         return f
 
-    async def _get_request_params(self, request):
-        if not self.is_method:
-            return request.path_params
+    def _validate_params(self, params):
         if self.params_validator is None:
             return {}
-        params = await request.json()
         try:
-            params = self.params_validator(params)
+            return self.params_validator(params)
         except Invalid as ex:
             raise ServiceInvalidParams(str(ex)) from None
-        return params
-
-    def _set_response_error(self, response, ex):
-        response.status = ex.status
-        response.headers["Service-Error"] = ex.code
-        response.json(dict(message=ex.message, data=ex.data))
 
-    def _set_response_result(self, response, returns):
+    async def _get_request_params(self, request):
+        if not self.is_method:
+            return request.path_params
+        if self.params_validator is None:
+            return {}
+        params = await _read_request_data(request)
+        return self._validate_params(params)
+
+    def _should_validate_returns(self):
+        mode = self.returns_validation
+        if mode == "always":
+            return True
+        if mode == "never":
+            return False
+        return random.random() < self.returns_sample_rate
+
+    def _validate_returns(self, returns):
+        """Validate returns by the returns validation mode
+
+        Invalid result raises in always mode, in sample mode it's logged
+        and counted, then the result is used as is.
+        """
         if self.returns_validator is None:
             if returns is not None:
                 LOG.info('Service return a value but no schema provided: %r', returns)
-            return
+            return None
+        if not self._should_validate_returns():
+            self.returns_metrics["skipped"] += 1
+            return returns
         try:
             returns = self.returns_validator(returns)
         except Invalid as ex:
+            self.returns_metrics["invalid"] += 1
+            if self.returns_validation == "sample":
+                LOG.error(f"Service {self.service_name}.{self.name} return a "
+                          f"invalid result (sampled): {ex}")
+                return returns
             LOG.error(f"Service return a invalid result: {ex}")
             raise
-        response.json(returns)
+        self.returns_metrics["validated"] += 1
+        return returns
+
+    async def _call_handler(self, service, params):
+        """Call the handler within the bulkheads"""
+        if not self.bulkheads:
+            return await self.handler(service, **params)
+        async with AsyncExitStack() as stack:
+            for bulkhead in self.bulkheads:
+                await stack.enter_async_context(bulkhead)
+            return await self.handler(service, **params)
+
+    def _get_timeout(self, context):
+        """Timeout of the handler, None means unlimited"""
+        timeout = context.remaining()
+        if self.max_timeout is not None:
+            if timeout is None or self.max_timeout < timeout:
+                timeout = self.max_timeout
+        return timeout
+
+    async def _with_timeout(self, timeout, fn, *args):
+        """Call fn(*args) within the timeout
+
+        Raises:
+            ServiceTimeout: deadline exceeded
+        """
+        if timeout is None:
+            return await fn(*args)
+        message = f"{self.service_name}.{self.name} deadline exceeded"
+        if timeout <= 0:
+            raise ServiceTimeout(message)
+        result = None
+        async with timeout_after(timeout) as is_timeout:
+            result = await fn(*args)
+        if is_timeout:
+            raise ServiceTimeout(message)
+        return result
+
+    async def _execute(self, service, params, use_msgpack):
+        """Returns JSON or MessagePack content of the result, None if no
+        returns schema. Content of large list is async generator of JSON
+        chunks, see Response.dump_json_chunks"""
+        returns = await self._call_handler(service, params)
+        returns = self._validate_returns(returns)
+        if self.returns_validator is None:
+            return None
+        if use_msgpack:
+            return service.response.dump_msgpack(returns)
+        if self.json_incremental:
+            chunks = service.response.dump_json_chunks(returns, self.returns_item_encoder)
+            if chunks is not None:
+                return chunks
+        if self.returns_encoder is not None:
+            return self.returns_encoder(returns)
+        return service.response.dump_json(returns)
+
+    async def _execute_value(self, service, params):
+        """Returns validated result, for entry of batch request"""
+        returns = await self._call_handler(service, params)
+        return self._validate_returns(returns)
+
+    async def _get_cached(self, params, variant, fn, *args):
+        """Call fn(*args) through the result cache and single flight"""
+        if self.cache is not None:
+            result = self.cache.get(params, variant=variant)
+            if result is not None:
+                return result
+        if self.single_flight is not None:
+            result = await self.single_flight.call(params, fn, *args, variant=variant)
+        else:
+            result = await fn(*args)
+        if self.cache is not None and result is not None:
+            self.cache.set(params, result, variant=variant)
+        return result
+
+    async def _get_result_content(self, service, params, use_msgpack):
+        variant = "msgpack" if use_msgpack else None
+        return await self._get_cached(
+            params, variant, self._execute, service, params, use_msgpack)
+
+    async def call_in_batch(self, context, request, params):
+        """Call the RPC method as an entry of batch request
+
+        The service has it's own response, but the context response
+        is kept as the batch response.
+
+        Returns:
+            validated result
+        Raises:
+            ServiceError: service error raised by the method
+        """
+        service = self.scope.instance(context)
+        service.request = request
+        batch_response = context.response
+        service.response = Response(context)
+        context.response = batch_response
+        params = self._validate_params(params)
+        # entries share the context, the deadline is not narrowed
+        timeout = self._get_timeout(context)
+        return await self._with_timeout(
+            timeout, self._get_cached, params, "batch",
+            self._execute_value, service, params)
+
+    async def _get_content(self, service, request, use_msgpack):
+        params = await self._get_request_params(request)
+        return await self._get_result_content(service, params, use_msgpack)
+
+    def _encode_item(self, context, item):
+        """Encode item of streaming method as a line of NDJSON"""
+        if self.returns_validator is not None:
+            item = self._validate_returns(item)
+        if self.returns_encoder is not None:
+            return self.returns_encoder(item) + b"\n"
+        sort_keys = context.config.json_sort_keys
+        return context.json_codec.dumps(item, sort_keys=sort_keys) + b"\n"
+
+    async def _stream_body(self, context, items):
+        """Stream items as NDJSON, lines are flushed by batch
+
+        Bulkheads are held until the stream finished. Error raised while
+        streaming is sent as the last line, the same as batch error entry.
+        """
+        lines = []
+        size = 0
+        try:
+            async with AsyncExitStack() as stack:
+                for bulkhead in self.bulkheads:
+                    await stack.enter_async_context(bulkhead)
+                while True:
+                    try:
+                        item = await self._with_timeout(
+                            context.remaining(), items.__anext__)
+                    except StopAsyncIteration:
+                        break
+                    line = self._encode_item(context, item)
+                    lines.append(line)
+                    size += len(line)
+                    full = len(lines) >= self.stream_flush_items
+                    if full or size >= self.stream_flush_size:
+                        yield b"".join(lines)
+                        lines.clear()
+                        size = 0
+        except Exception as ex:
+            if not isinstance(ex, HttpError):
+                LOG.error(f"Error raised when streaming {self.service_name}.{self.name}:",
+                          exc_info=ex)
+            error = context.json_codec.dumps(_format_error_entry(ex))
+            lines.append(error + b"\n")
+        finally:
+            await items.aclose()
+        if lines:
+            yield b"".join(lines)
+
+    async def _call_stream(self, context, service, request, use_msgpack):
+        try:
+            params = await self._with_timeout(
+                context.remaining(), self._get_request_params, request)
+            items = await self.handler(service, **params)
+        except ServiceError as ex:
+            _set_response_error(service.response, ex, use_msgpack)
+            return service.response
+        service.response.body = self._stream_body(context, items)
+        service.response.chunked = True
+        service.response.headers["Content-Type"] = NDJSON_MIMETYPE
+        return service.response
 
     async def __call__(self, context, request):
         service = self.scope.instance(context)
         service.request = request
         service.response = Response(context)
+        if self.max_body_size is not _NOT_SET:
+            request.max_body_size = self.max_body_size
+        use_msgpack = self.is_method and _use_msgpack(context, request)
+        _load_request_timeout(context, request)
+        if self.max_timeout is not None:
+            context.set_timeout(self.max_timeout)
+        if self.is_stream:
+            return await self._call_stream(context, service, request, use_msgpack)
         try:
-            params = await self._get_request_params(request)
-            returns = await self.handler(service, **params)
-            self._set_response_result(service.response, returns)
+            content = await self._with_timeout(
+                context.remaining(), self._get_content, service, request, use_msgpack)
+            if content is not None and use_msgpack:
+                service.response.msgpack_content(content)
+            elif content is not None:
+                service.response.json_content(content)
         except ServiceError as ex:
-            self._set_response_error(service.response, ex)
+            _set_response_error(service.response, ex, use_msgpack)
         return service.response
+
+
+class BatchHandler:
+    """Batch RPC endpoint, call many RPC methods concurrently in one request
+
+    Request body is a list of `{"method": "echo/echo", "params": {...}}`,
+    method is the RPC path without root path. Response body is a list of
+    `{"result": ...}` or `{"error": code, "message": ..., "data": ...}`
+    in the same order, error code is the Service-Error code, or http
+    status for other errors. All calls share the request context.
+    Request and response may be MessagePack, the same as RPC methods.
+    """
+
+    name = "batch"
+    is_method = False
+
+    def __init__(self, app, services):
+        config = app.config
+        root_path = config.root_path
+        self.path = (root_path + config.batch_path.lstrip("/")).lower()
+        self.routes = [Route(self.path, ["POST"])]
+        self.concurrency = config.batch_concurrency
+        self.max_size = config.batch_max_size
+        self.methods = {}
+        for service in services:
+            for handler in service.handlers:
+                if not handler.is_method:
+                    continue
+                for route in handler.routes:
+                    self.methods[route.path[len(root_path):]] = handler
+
+    def __repr__(self):
+        return f"<{type(self).__name__} {self.path}>"
+
+    def _parse_calls(self, calls):
+        if not isinstance(calls, list):
+            raise ServiceInvalidParams("batch calls should be a list")
+        if len(calls) > self.max_size:
+            msg = f"batch calls should be no more than {self.max_size}"
+            raise ServiceInvalidParams(msg)
+        ret = []
+        for index, call in enumerate(calls):
+            if not isinstance(call, dict) or not isinstance(call.get("method"), str):
+                msg = f"[{index}].method is required and should be a string"
+                raise ServiceInvalidParams(msg)
+            params = call.get("params")
+            if params is None:
+                params = {}
+            elif not isinstance(params, dict):
+                raise ServiceInvalidParams(f"[{index}].params should be a dict")
+            ret.append((call["method"], params))
+        return ret
+
+    async def _call(self, context, request, method, params):
+        handler = self.methods.get(method.lower())
+        if handler is None:
+            message = f"method {method!r} not found"
+            return dict(error=NotFound.status, message=message)
+        if handler.is_stream:
+            message = f"streaming method {method!r} can not be called in batch"
+            return dict(error=BadRequest.status, message=message)
+        try:
+            result = await handler.call_in_batch(context, request, params)
+        except HttpError as ex:
+            return _format_error_entry(ex)
+        except Exception as ex:
+            LOG.error(f"Error raised when call {method!r} in batch:", exc_info=ex)
+            return _format_error_entry(ex)
+        return dict(result=result)
+
+    async def __call__(self, context, request):
+        response = Response(context)
+        use_msgpack = _use_msgpack(context, request)
+        _load_request_timeout(context, request)
+        try:
+            calls = self._parse_calls(await _read_request_data(request))
+        except ServiceError as ex:
+            _set_response_error(response, ex, use_msgpack)
+            return response
+        results = [None] * len(calls)
+        pending = iter(range(len(calls)))
+
+        async def worker():
+            # workers share the pending iterator, limits the concurrency
+            for index in pending:
+                results[index] = await self._call(context, request, *calls[index])
+
+        async with open_nursery() as nursery:
+            for __ in range(min(self.concurrency, len(calls))):
+                await nursery.spawn(worker())
+        if use_msgpack:
+            response.msgpack(results)
+        else:
+            response.json(results)
+        return response
@@ -92,6 +92,7 @@ class Shell:
             "config": self.app.config,
             "headers": self.headers,
             "call": self._client.call,
+            "call_msgpack": self._client.call_msgpack,
         }
         for method in HTTP_METHODS:
             ctx[method.lower()] = getattr(self._client, method.lower())
@@ -0,0 +1,50 @@
+import pytest
+from newio import run, sleep, open_nursery
+
+from weirb.bulkhead import Bulkhead
+from weirb.error import ServiceUnavailable
+
+
+def test_bulkhead():
+    bulkhead = Bulkhead('test', max_concurrency=2, max_queue=2, queue_timeout=0.05)
+    order = []
+
+    async def call(results, n, cost):
+        try:
+            async with bulkhead:
+                order.append(n)
+                await sleep(cost)
+        except ServiceUnavailable as ex:
+            results.append((n, ex.message))
+        else:
+            results.append((n, 'ok'))
+
+    async def main():
+        results = []
+        async with open_nursery() as nursery:
+            await nursery.spawn(call(results, 0, 0.03))
+            await nursery.spawn(call(results, 1, 0.2))
+            await sleep(0.01)
+            assert bulkhead.in_flight == 2
+            # queued in FIFO order, then call 4 is rejected
+            for n in [2, 3, 4]:
+                await nursery.spawn(call(results, n, 0.1))
+            await sleep(0.01)
+            assert bulkhead.queued == 2
+        return dict(results)
+
+    results = run(main())
+    assert order == [0, 1, 2]
+    assert results[2] == 'ok'
+    assert 'wait queue timeout' in results[3]
+    assert 'wait queue is full' in results[4]
+    assert bulkhead.info() == dict(
+        in_flight=0, queued=0, max_concurrency=2, max_queue=2,
+        rejected=1, timeouts=1)
+
+
+def test_bulkhead_params():
+    with pytest.raises(ValueError):
+        Bulkhead('test', max_concurrency=0)
+    with pytest.raises(ValueError):
+        Bulkhead('test', max_concurrency=1, max_queue=-1)
@@ -0,0 +1,49 @@
+from newio import run, sleep, open_nursery
+
+from weirb.cache import ResultCache, SingleFlight
+from weirb.error import ServiceInvalidParams
+
+
+def test_single_flight():
+    single_flight = SingleFlight()
+    executions = []
+
+    async def execute(n):
+        executions.append(n)
+        await sleep(0.01)
+        if n < 0:
+            raise ServiceInvalidParams('negative')
+        return n * 2
+
+    async def call(results, n):
+        try:
+            results.append(await single_flight.call(dict(n=n), execute, n))
+        except ServiceInvalidParams as ex:
+            results.append(ex.message)
+
+    async def main():
+        results = []
+        async with open_nursery() as nursery:
+            for n in [1, 1, 2, 1, -1, -1]:
+                await nursery.spawn(call(results, n))
+        return results
+
+    results = run(main())
+    expect = [2, 2, 4, 2, 'negative', 'negative']
+    assert sorted(results, key=str) == sorted(expect, key=str)
+    assert sorted(executions) == [-1, 1, 2]
+    info = single_flight.info()
+    assert info['calls'] == 6 and info['coalesced'] == 3
+    assert info['coalescing_ratio'] == 0.5
+
+
+def test_result_cache_variants():
+    cache = ResultCache(maxsize=1)
+    cache.set(dict(n=1), b'json')
+    assert cache.get(dict(n=1), variant='msgpack') is None
+    cache.set(dict(n=1), b'msgpack', variant='msgpack')
+    assert cache.get(dict(n=1)) == b'json'
+    assert cache.get(dict(n=1), variant='msgpack') == b'msgpack'
+    assert len(cache) == 1
+    assert cache.invalidate(n=1)
+    assert cache.get(dict(n=1)) is None
@@ -0,0 +1,59 @@
+import json
+
+import pytest
+from validr import T
+
+from weirb.encoder import compile_json_encoder
+
+Item = T.dict(
+    id=T.int,
+    name=T.str,
+    score=T.float,
+    ok=T.bool,
+    tags=T.list(T.str),
+    matrix=T.list(T.list(T.int)),
+    extra=T.any,
+    child=T.dict(id=T.int).optional,
+    created_at=T.datetime,
+    **{'we"ird{key}\'': T.int},
+)
+
+
+def make_item(**kwargs):
+    item = {
+        'id': 1,
+        'name': '中文"\n\\',
+        'score': 1.5,
+        'ok': True,
+        'tags': ['a', 'b'],
+        'matrix': [[1, 2], [], [3]],
+        'extra': {'x': [1, None]},
+        'child': {'id': 2},
+        'created_at': '2019-01-01T00:00:00.000000Z',
+        'we"ird{key}\'': 3,
+    }
+    item.update(kwargs)
+    return item
+
+
+@pytest.mark.parametrize('value', [
+    [make_item()],
+    [make_item(child=None, extra=None, tags=[])],
+    # mismatched values fallback to the generic encoder
+    [make_item(id=True, score=1, ok=0, name=None, tags='x', matrix=[None])],
+    [make_item(score=float('nan')), make_item(score=float('inf'))],
+    [make_item(child={'id': 1, 'name': 'x'}), {'id': 1}, None],
+    [],
+    {'x': 1},
+    None,
+])
+@pytest.mark.parametrize('sort_keys', [False, True])
+def test_compile_json_encoder(value, sort_keys):
+    encoder = compile_json_encoder(T(T.list(Item)).__schema__, sort_keys=sort_keys)
+    expect = json.dumps(value, ensure_ascii=False, sort_keys=sort_keys)
+    assert encoder(value) == expect.encode('utf-8')
+
+
+def test_compile_json_encoder_any():
+    encoder = compile_json_encoder(T(T.any).__schema__)
+    assert encoder({'a': [1, '中']}) == '{"a": [1, "中"]}'.encode('utf-8')
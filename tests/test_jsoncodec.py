@@ -0,0 +1,76 @@
+import json
+
+import pytest
+
+from weirb.jsoncodec import load_json_codec, make_encoder, StdlibJsonCodec
+from weirb.jsoncodec import estimate_list_size, iter_encode_list
+
+
+class UpperCodec:
+    def loads(self, content):
+        return json.loads(content)
+
+    def dumps(self, value, *, indent=None, sort_keys=False):
+        return json.dumps(value).upper().encode('utf-8')
+
+
+def _installed_backends():
+    backends = ['stdlib']
+    for name in ['ujson', 'orjson']:
+        try:
+            __import__(name)
+        except ImportError:
+            continue
+        backends.append(name)
+    return backends
+
+
+@pytest.mark.parametrize('backend', _installed_backends())
+def test_json_codec(backend):
+    codec = load_json_codec(backend)
+    value = {'b': [1, 2.5, None, True], 'a': '中文"/\n'}
+    content = codec.dumps(value)
+    assert isinstance(content, bytes)
+    assert codec.loads(content) == value
+    assert codec.loads(content.decode('utf-8')) == value
+    assert json.loads(codec.dumps(value, indent=4)) == value
+    assert list(json.loads(codec.dumps(value, sort_keys=True))) == ['a', 'b']
+    with pytest.raises(ValueError):
+        codec.loads(b'{"a":')
+    with pytest.raises(ValueError):
+        codec.loads(b'"\xff"')
+
+
+def test_load_json_codec():
+    assert isinstance(load_json_codec('stdlib'), StdlibJsonCodec)
+    codec = load_json_codec(f'{__name__}:UpperCodec')
+    assert codec.dumps({'a': 1}) == b'{"A": 1}'
+    with pytest.raises(ImportError):
+        load_json_codec('unknown')
+    with pytest.raises(ImportError):
+        load_json_codec(f'{__name__}:NotExists')
+    with pytest.raises(TypeError):
+        load_json_codec(f'{__name__}:_installed_backends')
+
+
+def test_make_encoder():
+    value = {'b': [1, 2.5, float('nan')], 'a': '中文'}
+    for sort_keys in [False, True]:
+        encode = make_encoder(sort_keys=sort_keys)
+        assert encode(value) == json.dumps(value, ensure_ascii=False, sort_keys=sort_keys)
+
+
+@pytest.mark.parametrize('chunk_size', [0, 10, 16 * 1024])
+@pytest.mark.parametrize('items', [[], [1], [{'a': '中'}, None, [1, 2]] * 10])
+def test_iter_encode_list(items, chunk_size):
+    codec = StdlibJsonCodec()
+    chunks = list(iter_encode_list(items, codec.dumps, chunk_size=chunk_size))
+    assert b''.join(chunks) == json.dumps(items, ensure_ascii=False).encode('utf-8')
+    assert all(len(x) >= chunk_size for x in chunks[:-1])
+
+
+def test_estimate_list_size():
+    codec = StdlibJsonCodec()
+    items = [{'id': i} for i in range(1000, 2000)]
+    assert estimate_list_size(items, codec.dumps) == len(codec.dumps(items))
+    assert estimate_list_size([], codec.dumps) == 2
@@ -0,0 +1,70 @@
+from newio import run
+
+from weirb.error import BadRequest, RequestEntityTooLarge
+from weirb.multipart import MultipartReader, parse_multipart
+
+BODY = (
+    b'preamble\r\n'
+    b'--xyz\r\n'
+    b'Content-Disposition: form-data; name="text"\r\n'
+    b'\r\n'
+    b'hello\r\n--world\r\n'
+    b'--xyz\r\n'
+    b'Content-Disposition: form-data; name="file"; filename="a.txt"\r\n'
+    b'Content-Type: text/plain\r\n'
+    b'\r\n'
+) + b'0123456789' * 100 + (
+    b'\r\n--xyz--\r\n'
+    b'epilogue'
+)
+
+
+async def stream_chunks(data, size):
+    for i in range(0, len(data), size):
+        yield data[i:i + size]
+
+
+def test_parse_multipart():
+    for size in [1, 7, 64, len(BODY)]:
+        reader = MultipartReader(stream_chunks(BODY, size), b'xyz')
+        fields, files = run(parse_multipart(reader, spool_size=100))
+        assert fields == [('text', 'hello\r\n--world')]
+        (name, storage), = files
+        assert name == 'file'
+        assert storage.filename == 'a.txt'
+        assert storage.content_type == 'text/plain'
+        assert storage.stream._rolled
+        assert storage.read() == b'0123456789' * 100
+
+
+def test_stream_parts():
+    async def main():
+        names = []
+        reader = MultipartReader(stream_chunks(BODY, 10), b'xyz')
+        async for part in reader:
+            # data not read is skipped
+            names.append(part.name)
+        return names
+
+    assert run(main()) == ['text', 'file']
+
+
+def test_incomplete_multipart():
+    reader = MultipartReader(stream_chunks(BODY[:-30], 10), b'xyz')
+    try:
+        run(parse_multipart(reader))
+    except BadRequest:
+        pass
+    else:
+        assert False, 'BadRequest not raised'
+
+
+def test_field_too_large():
+    for max_field_size, error in [(14, None), (13, RequestEntityTooLarge)]:
+        reader = MultipartReader(stream_chunks(BODY, 7), b'xyz')
+        try:
+            run(parse_multipart(reader, max_field_size=max_field_size))
+        except RequestEntityTooLarge as ex:
+            assert error is not None and "'text'" in ex.message
+        else:
+            assert error is None
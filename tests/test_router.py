@@ -0,0 +1,113 @@
+import pytest
+
+from weirb.router import Router
+from weirb.error import NotFound, MethodNotAllowed, HttpRedirect
+
+
+class Route:
+    def __init__(self, path, methods):
+        self.path = path
+        self.methods = methods
+
+
+class Handler:
+    def __init__(self, name, path, methods, is_method=False):
+        self.name = name
+        self.routes = [Route(path, methods)]
+        self.is_method = is_method
+
+
+class Service:
+    def __init__(self, handlers):
+        self.handlers = handlers
+
+
+def create_router(server_name=None):
+    handlers = [
+        Handler('echo', '/echo/echo', ['POST'], is_method=True),
+        Handler('dir', '/dir/', ['GET']),
+        Handler('user', '/user/<int:id>', ['GET']),
+        Handler('me', '/user/me', ['GET']),
+        Handler('named', '/user/<name>', ['PUT']),
+        Handler('file', '/file/<path:path>/raw', ['GET']),
+        Handler('json', '/json/<name>.json', ['GET']),
+    ]
+    return Router([Service(handlers)], server_name)
+
+
+def lookup(router, path, method):
+    handler, params = router.lookup(path, method)
+    return handler.name, params
+
+
+def test_lookup():
+    router = create_router()
+    assert lookup(router, '/echo/echo', 'POST') == ('echo', {})
+    assert lookup(router, '/user/123', 'GET') == ('user', {'id': 123})
+    assert lookup(router, '/user/123', 'HEAD') == ('user', {'id': 123})
+    assert lookup(router, '/user/me', 'GET') == ('me', {})
+    assert lookup(router, '/user/bob', 'PUT') == ('named', {'name': 'bob'})
+    assert lookup(router, '/file/a/b/raw', 'GET') == ('file', {'path': 'a/b'})
+    assert lookup(router, '/json/x.json', 'GET') == ('json', {'name': 'x'})
+
+
+@pytest.mark.parametrize('path,method,error', [
+    ('/echo/echo', 'GET', MethodNotAllowed),
+    ('/user/bob', 'GET', MethodNotAllowed),
+    ('/user/123/', 'GET', NotFound),
+    ('/json/x.txt', 'GET', NotFound),
+    ('/dir', 'POST', MethodNotAllowed),
+    ('/unknown', 'GET', NotFound),
+])
+def test_lookup_error(path, method, error):
+    with pytest.raises(error):
+        create_router().lookup(path, method)
+
+
+def test_redirect():
+    with pytest.raises(HttpRedirect) as info:
+        create_router().lookup('/dir', 'GET')
+    assert info.value.location == '/dir/'
+    with pytest.raises(HttpRedirect) as info:
+        create_router('example.com').lookup('/dir', 'GET')
+    assert info.value.location == 'http://example.com/dir/'
+
+
+def test_route_cache():
+    router = Router(create_router().services, None, negative_cache_size=2)
+    for __ in range(2):
+        with pytest.raises(NotFound):
+            router.lookup('/unknown', 'GET')
+    # paths with IDs don't evict hot entries
+    for i in range(100):
+        assert lookup(router, f'/user/{i}', 'GET') == ('user', {'id': i})
+        assert lookup(router, '/user/me', 'GET') == ('me', {})
+    routes = router.cache_info()['routes']
+    assert routes['hits'] == 100 and routes['misses'] == 102
+    errors = router.cache_info()['errors']
+    assert errors['evictions'] == 0 and errors['size'] == 1
+    with pytest.raises(NotFound):
+        router.lookup('/unknown', 'GET')
+    assert router.cache_info()['errors']['hits'] == 2
+
+
+def test_negative_cache():
+    router = create_router()
+    for __ in range(3):
+        with pytest.raises(NotFound):
+            router.lookup('/unknown', 'GET')
+    with pytest.raises(HttpRedirect):
+        router.lookup('/dir', 'GET')
+    with pytest.raises(HttpRedirect) as info:
+        router.lookup('/dir', 'GET')
+    assert info.value.location == '/dir/'
+    errors = router.cache_info()['errors']
+    assert errors['hits'] == 3 and errors['size'] == 2
+
+
+def test_rpc_dispatch():
+    router = create_router()
+    for __ in range(2):
+        assert lookup(router, '/echo/echo', 'POST') == ('echo', {})
+    # resolved before the static routes table
+    assert router.cache_info()['routes']['misses'] == 0
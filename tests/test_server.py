@@ -0,0 +1,543 @@
+import os
+import re
+import sys
+import time
+import signal
+import queue
+import socket
+import threading
+import subprocess
+import urllib.request
+
+from validr import T
+from newio import run, sleep, open_nursery
+from newio import socket as newio_socket
+
+from weirb import App, concurrency_limit
+from weirb.server.parser import RequestParser
+from weirb.server.worker import Worker
+from weirb.error import RequestTimeout, RequestEntityTooLarge
+from weirb.server.admission import Admission
+from weirb.server.timer import TimerWheel, HEADER, WRITE
+from weirb.compat.contextlib import asynccontextmanager
+
+
+class MockSocket:
+    def __init__(self, chunks=(), max_send_size=5):
+        self.chunks = list(chunks)
+        self.max_send_size = max_send_size
+        self.sent = b''
+        self.socket = self
+        self.shutdown_how = None
+
+    def shutdown(self, how):
+        self.shutdown_how = how
+
+    async def recv(self, size):
+        if not self.chunks:
+            return b''
+        return self.chunks.pop(0)[:size]
+
+    async def recv_into(self, buffer):
+        if not self.chunks:
+            return 0
+        chunk = self.chunks.pop(0)
+        buffer[:len(chunk)] = chunk
+        return len(chunk)
+
+    async def sendmsg(self, buffers):
+        data = b''.join(buffers)[:self.max_send_size]
+        self.sent += data
+        return len(data)
+
+    async def close(self):
+        pass
+
+
+def create_parser(chunks, max_body_size=1024 * 1024, max_content_length=None,
+                  sock=None, wheel=None, timeout=1):
+    if max_content_length is None:
+        max_content_length = max_body_size
+    if sock is None:
+        sock = MockSocket(chunks)
+    if wheel is None:
+        wheel = TimerWheel()
+    return RequestParser(
+        sock, ('127.0.0.1', 12345), wheel.deadline(sock),
+        header_timeout=timeout,
+        body_timeout=timeout,
+        keep_alive_timeout=timeout,
+        max_header_size=8 * 1024,
+        max_body_size=max_body_size,
+        max_content_length=max_content_length,
+        header_buffer_size=1024,
+        body_buffer_size=16 * 1024,
+    )
+
+
+async def read_body(request):
+    chunks = []
+    async for chunk in request.body:
+        chunks.append(chunk)
+    return b''.join(chunks)
+
+
+def test_pipelining():
+    parser = create_parser([
+        b'POST /a HTTP/1.1\r\nContent-Length: 3\r\n\r\nabc'
+        b'GET /b HTTP/1.1\r\n\r\nPOST /c HTTP/1.1\r\nContent-Le',
+        b'ngth: 3\r\n\r\nx',
+        b'yz',
+    ])
+
+    async def main():
+        result = []
+        while True:
+            request = await parser.parse()
+            if request is None:
+                break
+            result.append((request.url, await read_body(request)))
+        return result
+
+    assert run(main()) == [('/a', b'abc'), ('/b', b''), ('/c', b'xyz')]
+
+
+def test_pipelining_unread_body():
+    parser = create_parser([
+        b'POST /a HTTP/1.1\r\nContent-Length: 3\r\n\r\nab',
+        b'cGET /b HTTP/1.1\r\n\r\n',
+    ])
+
+    async def main():
+        first = await parser.parse()
+        second = await parser.parse()
+        return first.url, second.url, await read_body(second)
+
+    assert run(main()) == ('/a', '/b', b'')
+
+
+def test_request_headers():
+    parser = create_parser([
+        b'GET / HTTP/1.1\r\nHost: example.com\r\nX-Tag: a\r\n'
+        b'x-tag: b\r\nX-Name: \xe4\xbd\xa0\xe5\xa5\xbd\r\n\r\n',
+    ])
+    headers = run(parser.parse()).headers
+    assert headers['HOST'] == 'example.com'
+    assert headers.get('content-length') is None
+    assert headers.getlist('X-TAG') == ['a', 'b']
+    assert headers.get('X-Name') == '\u4f60\u597d'
+    assert 'x-name' in headers and 'X-Other' not in headers
+    assert headers.items()[:2] == [('Host', 'example.com'), ('X-Tag', 'a')]
+
+
+CHUNKED_REQUEST = (
+    b'POST /a HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\n'
+    b'5\r\nhello\r\n6\r\n world\r\n0\r\n\r\n'
+)
+
+
+def test_chunked_body_too_large():
+    parser = create_parser([CHUNKED_REQUEST[:60], CHUNKED_REQUEST[60:]], max_body_size=8)
+    request = run(parser.parse())
+    try:
+        run(read_body(request))
+    except RequestEntityTooLarge:
+        pass
+    else:
+        assert False, 'RequestEntityTooLarge not raised'
+
+
+def test_override_max_body_size():
+    parser = create_parser([CHUNKED_REQUEST], max_body_size=8)
+    request = run(parser.parse())
+    request.max_body_size = 11
+    assert run(read_body(request)) == b'hello world'
+
+
+def test_content_length_too_large():
+    chunks = [b'PUT /a HTTP/1.1\r\nContent-Length: 9\r\n\r\n']
+    parser = create_parser(chunks, max_body_size=8)
+    try:
+        run(parser.parse())
+    except RequestEntityTooLarge:
+        pass
+    else:
+        assert False, 'RequestEntityTooLarge not raised'
+    # handlers may override the limit, checked when reading the body
+    parser = create_parser(list(chunks), max_body_size=8, max_content_length=9)
+    request = run(parser.parse())
+    try:
+        run(read_body(request))
+    except RequestEntityTooLarge:
+        pass
+    else:
+        assert False, 'RequestEntityTooLarge not raised'
+
+
+class MockConfig:
+    response_flush_threshold = 1024
+    response_write_timeout = 1
+
+
+class MockApp:
+    config = MockConfig()
+
+
+class MockResponse:
+    version = 'HTTP/1.1'
+    status = 200
+    status_text = 'OK'
+    headers = [('Transfer-Encoding', 'chunked')]
+    chunked = True
+    keep_alive = None
+
+    def __init__(self, chunks):
+        self.body = stream_chunks(chunks)
+
+
+async def stream_chunks(chunks):
+    for chunk in chunks:
+        yield chunk
+
+
+def test_send_chunked_response():
+    sock = MockSocket(max_send_size=7)
+    deadline = TimerWheel().deadline(sock)
+    worker = Worker(MockApp(), None, sock, ('127.0.0.1', 12345), deadline, Admission())
+
+    async def main():
+        await worker._send_response(MockResponse([b'hello', b'', b'world' * 4]))
+        await worker._flush()
+
+    run(main())
+    assert sock.sent == (
+        b'HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n'
+        b'5\r\nhello\r\n14\r\n' + b'world' * 4 + b'\r\n0\r\n\r\n'
+    )
+
+
+class DisconnectSocket(MockSocket):
+    """The client disconnects after received max_size bytes"""
+
+    def __init__(self, chunks, max_size):
+        super().__init__(chunks, max_send_size=max_size)
+
+    async def sendmsg(self, buffers):
+        if len(self.sent) >= self.max_send_size:
+            raise BrokenPipeError()
+        return await super().sendmsg(buffers)
+
+
+class RowsService:
+    closed = False
+
+    @concurrency_limit(1)
+    async def do_rows(self) -> T.dict(i=T.int):
+        try:
+            for i in range(1000):
+                yield dict(i=i)
+        finally:
+            RowsService.closed = True
+
+
+def test_disconnect_streaming():
+    app = App(__name__, stream_flush_items=1, response_flush_threshold=0)
+    body = b'{}'
+    request = (b'POST /rows/rows HTTP/1.1\r\nContent-Type: application/json\r\n'
+               b'Content-Length: %d\r\n\r\n' % len(body)) + body
+    parser = create_parser([request])
+    sock = DisconnectSocket(parser.cli_sock.chunks, max_size=200)
+    parser.cli_sock = sock
+    admission = Admission()
+    admission.admit_connection()
+    worker = Worker(app, parser, sock, ('127.0.0.1', 12345), parser.deadline, admission)
+
+    async def main():
+        await worker.main()
+        # released once the write failed, not when garbage collected
+        return RowsService.closed, app.bulkhead_info()['Rows.do_rows']['in_flight']
+
+    assert run(main()) == (True, 0)
+    assert sock.sent.startswith(b'HTTP/1.1 200 OK\r\n')
+
+
+class MockHandlerApp:
+    config = MockConfig()
+
+    def __init__(self, handler):
+        self.handler = handler
+
+    @asynccontextmanager
+    async def context(self):
+        yield self.handler
+
+
+def run_worker(parser, handler):
+    sock = parser.cli_sock
+    sock.max_send_size = 1024
+    admission = Admission()
+    admission.admit_connection()
+    worker = Worker(MockHandlerApp(handler), parser, sock, ('127.0.0.1', 12345),
+                    parser.deadline, admission)
+    run(worker.main())
+    return sock
+
+
+class RecordSocket(MockSocket):
+    """Record bytes sent before each recv"""
+
+    def __init__(self, chunks):
+        super().__init__(chunks, max_send_size=1024)
+        self.sent_before_recv = []
+
+    async def recv_into(self, buffer):
+        self.sent_before_recv.append(self.sent)
+        return await super().recv_into(buffer)
+
+
+def test_pipelining_flush():
+    slow = b'GET /slow HTTP/1.1\r\n\r\n'
+    fast = b'GET /fast HTTP/1.1\r\n\r\n'
+    partial = b'POST /c HTTP/1.1\r\nContent-Length: 3\r\n\r\nx'
+    sock = RecordSocket([slow + fast + partial, b'yz'])
+    parser = create_parser([], sock=sock)
+
+    async def handler(request):
+        if request.url == '/slow':
+            await sleep(0.01)
+        await read_body(request)
+        return MockResponse([request.url.encode()])
+
+    run_worker(parser, handler)
+    # responses of completely received requests are coalesced, and flushed
+    # before waiting for the rest of the partial request
+    assert sock.sent_before_recv[1].count(b'HTTP/1.1 200 OK') == 2
+    assert sock.sent.count(b'HTTP/1.1 200 OK') == 3
+
+
+def test_unread_body_too_large():
+    parser = create_parser([CHUNKED_REQUEST[:60], CHUNKED_REQUEST[60:]],
+                           max_body_size=8)
+
+    async def handler(request):
+        return MockResponse([b'ok'])
+
+    sock = run_worker(parser, handler)
+    # the connection is closed instead of sending 413 after the response
+    assert sock.sent.count(b'HTTP/1.1 ') == 1
+    assert sock.sent.startswith(b'HTTP/1.1 200 OK\r\n')
+
+
+def test_read_body_too_large():
+    rest = b'f\r\n' + b'x' * 15 + b'\r\n'
+    parser = create_parser([CHUNKED_REQUEST[:58], rest, rest, CHUNKED_REQUEST],
+                           max_body_size=8)
+
+    async def handler(request):
+        await read_body(request)
+
+    sock = run_worker(parser, handler)
+    assert sock.sent.startswith(b'HTTP/1.1 413 ')
+    assert sock.sent.count(b'HTTP/1.1 ') == 1
+    # the connection is closed, the rest body is not read and buffered
+    assert sock.chunks
+    assert not parser._active.body_chunks
+
+
+def test_timer_wheel():
+    wheel = TimerWheel(granularity=1, num_slots=8)
+    socks = [MockSocket() for __ in range(3)]
+    deadlines = [wheel.deadline(sock) for sock in socks]
+    now = wheel._current_tick + 0.5
+    deadlines[0].set_expires(HEADER, now + 3)
+    deadlines[1].set_expires(WRITE, now + 20)
+    deadlines[2].set_expires(HEADER, now + 2)
+    deadlines[2].clear()
+    assert wheel.expire(now + 2.9) == 0
+    # extend the deadline, it's rescheduled when the old slot comes
+    deadlines[0].set_expires(HEADER, now + 5)
+    assert wheel.expire(now + 4) == 0
+    assert wheel.expire(now + 6) == 1
+    assert deadlines[0].expired == HEADER
+    assert socks[0].shutdown_how == socket.SHUT_RD
+    # deadlines more than one round of the wheel later
+    assert wheel.expire(now + 19) == 0
+    assert wheel.expire(now + 21) == 1
+    assert deadlines[1].expired == WRITE
+    assert socks[1].shutdown_how == socket.SHUT_RDWR
+    assert deadlines[2].expired is None
+
+
+def test_header_timeout():
+    wheel = TimerWheel(granularity=0.02)
+    expired = []
+
+    async def expire_deadlines():
+        while not expired:
+            await sleep(wheel.granularity)
+            num_expired = wheel.expire()
+            if num_expired:
+                expired.append(num_expired)
+
+    async def main():
+        server_sock, client_sock = newio_socket.socketpair()
+        parser = create_parser([], sock=server_sock, wheel=wheel, timeout=0.1)
+        # send partial headers, then the wheel expires the header deadline
+        # while waiting for the rest headers, and recv gets EOF
+        await client_sock.sendall(b'GET / HTTP/1.1\r\n')
+        async with open_nursery() as nursery:
+            await nursery.spawn(expire_deadlines())
+            try:
+                await parser.parse()
+            except RequestTimeout:
+                return parser.deadline.expired, expired
+            finally:
+                await client_sock.close()
+                await server_sock.close()
+
+    assert run(main()) == (HEADER, [1])
+
+
+def test_admission():
+    admission = Admission(max_connections=2, max_requests=1)
+    assert admission.admit_connection() and admission.admit_connection()
+    assert not admission.admit_connection()
+    admission.release_connection()
+    assert admission.admit_connection()
+    assert admission.admit_request()
+    assert not admission.admit_request()
+    assert admission.occupancy == dict(
+        connections=2, max_connections=2,
+        requests=1, max_requests=1,
+        shed_connections=1, shed_requests=1,
+    )
+    response = admission.overload_response
+    assert response.startswith(b'HTTP/1.1 503 Service Unavailable\r\n')
+    assert b'\r\nRetry-After: 1\r\n' in response
+
+
+def test_shed_connection():
+    admission = Admission(max_connections=1)
+
+    async def main():
+        server_sock, client_sock = newio_socket.socketpair()
+        deadline = TimerWheel().deadline(server_sock)
+        # the unread request would cause connection reset without draining
+        await client_sock.sendall(b'POST / HTTP/1.1\r\nContent-Length: 5\r\n\r\nhello')
+        await client_sock.shutdown(socket.SHUT_WR)
+        await admission.shed_connection(server_sock, deadline)
+        received = b''
+        while True:
+            data = await client_sock.recv(1024)
+            if not data:
+                break
+            received += data
+        await client_sock.close()
+        return received, deadline.kind
+
+    assert run(main()) == (admission.overload_response, None)
+
+
+def test_shed_request():
+    parser = create_parser([b'POST / HTTP/1.1\r\nContent-Length: 5\r\n\r\n', b'hello'])
+    sock = parser.cli_sock
+    sock.max_send_size = 1024
+    admission = Admission(max_requests=1)
+    admission.admit_request()
+    admission.admit_connection()
+    worker = Worker(MockApp(), parser, sock, ('127.0.0.1', 12345),
+                    parser.deadline, admission)
+    run(worker.main())
+    assert sock.sent == admission.overload_response
+    # the unread body is drained after shutdown the write side
+    assert sock.shutdown_how == socket.SHUT_WR and not sock.chunks
+    assert admission.occupancy['connections'] == 0
+    assert admission.occupancy['requests'] == 1
+
+
+PREFORK_APP = """
+import os
+from weirb import App, route
+
+
+class PidService:
+    @route.get('/pid')
+    async def get_pid(self):
+        self.response.body = str(os.getpid())
+
+
+if __name__ == '__main__':
+    App('prefork_app', port=int(os.environ['PORT']), workers=2).serve()
+"""
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _read_lines(proc):
+    lines = queue.Queue()
+
+    def reader():
+        for line in proc.stdout:
+            lines.put(line)
+
+    threading.Thread(target=reader, daemon=True).start()
+    return lines
+
+
+def _read_worker_pids(lines, num_workers, timeout=10):
+    pids = []
+    deadline = time.monotonic() + timeout
+    while len(pids) < num_workers:
+        remaining = deadline - time.monotonic()
+        assert remaining > 0, 'workers not started'
+        try:
+            line = lines.get(timeout=remaining)
+        except queue.Empty:
+            continue
+        # outputs of workers may be interleaved in one line
+        pids.extend(int(pid) for pid in re.findall(r'Worker PID=(\d+) started', line))
+    return pids
+
+
+def _get_pid(port):
+    url = f'http://127.0.0.1:{port}/pid'
+    with urllib.request.urlopen(url, timeout=5) as response:
+        return int(response.read())
+
+
+def test_prefork(tmp_path):
+    (tmp_path / 'prefork_app.py').write_text(PREFORK_APP)
+    port = _free_port()
+    env = dict(os.environ, PORT=str(port), PYTHONUNBUFFERED='1')
+    env['PYTHONPATH'] = os.pathsep.join([str(tmp_path), env.get('PYTHONPATH', '')])
+    proc = subprocess.Popen(
+        [sys.executable, 'prefork_app.py'], cwd=str(tmp_path), env=env,
+        stdout=subprocess.PIPE, universal_newlines=True)
+    lines = _read_lines(proc)
+    try:
+        pids = _read_worker_pids(lines, 2)
+        assert proc.pid not in pids
+        assert _get_pid(port) in pids
+        # the killed worker is respawned by master
+        os.kill(pids[0], signal.SIGKILL)
+        new_pid, = _read_worker_pids(lines, 1)
+        assert new_pid not in pids
+        assert _get_pid(port) in {pids[1], new_pid}
+        # master stops workers and exits on SIGTERM
+        proc.send_signal(signal.SIGTERM)
+        assert proc.wait(timeout=10) == 0
+        for pid in [pids[1], new_pid]:
+            try:
+                os.kill(pid, 0)
+            except ProcessLookupError:
+                pass
+            else:
+                assert False, f'worker {pid} not stopped'
+    finally:
+        if proc.poll() is None:
+            proc.send_signal(signal.SIGTERM)
+            proc.wait(timeout=10)
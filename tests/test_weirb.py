@@ -1,7 +1,16 @@
+import os
+import json
+import hashlib
+
+import pytest
 from validr import T
 
-from weirb import App, Client
-from weirb.error import ServiceInvalidParams
+from newio import sleep
+
+from weirb import App, Client, route, cached, get_cache, validate_returns
+from weirb import concurrency_limit, max_timeout, offload
+from weirb.error import ServiceInvalidParams, ServiceTimeout
+from weirb.response import FileBody
 
 
 class EchoService:
@@ -12,8 +21,327 @@ class EchoService:
 def test_echo():
     app = App(__name__)
     client = Client(app)
-    text = 'hello'
-    res = client.call('/echo/echo', text=text)
-    assert res.json == dict(text=text)
-    res = client.call('/echo/echo')
-    assert res.error == ServiceInvalidParams.code
+    try:
+        text = 'hello'
+        res = client.call('/echo/echo', text=text)
+        assert res.json == dict(text=text)
+        res = client.call('/echo/echo')
+        assert res.error == ServiceInvalidParams.code
+    finally:
+        client.close()
+
+
+def test_batch_disabled():
+    client = Client(App(__name__))
+    try:
+        assert client.request('/batch', method='POST').status == 404
+    finally:
+        client.close()
+
+
+def test_batch():
+    app = App(__name__, batch_enable=True)
+    client = Client(app)
+    try:
+        calls = [
+            dict(method='echo/echo', params=dict(text='a')),
+            dict(method='echo/echo'),
+            dict(method='echo/unknown'),
+            dict(method='echo/echo', params=dict(text='b')),
+        ]
+        headers = {'Content-Type': 'application/json'}
+        body = json.dumps(calls)
+        res = client.request('/batch', method='POST', body=body, headers=headers)
+        results = res.json
+        assert results[0] == dict(result=dict(text='a'))
+        assert results[1]['error'] == ServiceInvalidParams.code
+        assert results[2]['error'] == 404
+        assert results[3] == dict(result=dict(text='b'))
+        res = client.request('/batch', method='POST', body='{}', headers=headers)
+        assert res.error == ServiceInvalidParams.code
+    finally:
+        client.close()
+
+
+@pytest.mark.parametrize('backend', ['stdlib', 'orjson'])
+def test_json_backend(backend):
+    pytest.importorskip(backend if backend != 'stdlib' else 'json')
+    app = App(__name__, json_backend=backend)
+    client = Client(app)
+    try:
+        res = client.call('/echo/echo', text='中文')
+        assert res.json == dict(text='中文')
+        headers = {'Content-Type': 'application/json'}
+        body = b'{"text":'
+        res = client.request('/echo/echo', method='POST', body=body, headers=headers)
+        assert res.status == 400
+    finally:
+        client.close()
+
+
+def test_msgpack():
+    msgpack = pytest.importorskip('msgpack')
+    app = App(__name__, msgpack_enable=True, batch_enable=True)
+    client = Client(app)
+    try:
+        res = client.call_msgpack('/echo/echo', text='中文')
+        assert res.is_msgpack and res.msgpack == dict(text='中文')
+        res = client.call_msgpack('/echo/echo')
+        assert res.error == ServiceInvalidParams.code
+        assert 'message' in res.msgpack
+        # response format is negotiated by Accept header
+        headers = {'Content-Type': 'application/msgpack', 'Accept': 'application/json'}
+        body = msgpack.packb(dict(text='hi'))
+        res = client.request('/echo/echo', method='POST', body=body, headers=headers)
+        assert res.json == dict(text='hi')
+        headers = {'Content-Type': 'application/msgpack'}
+        res = client.request('/echo/echo', method='POST', body=b'\xc1', headers=headers)
+        assert res.status == 400
+        calls = [dict(method='echo/echo', params=dict(text='hi'))]
+        body = msgpack.packb(calls)
+        res = client.request('/batch', method='POST', body=body, headers=headers)
+        assert res.msgpack == [dict(result=dict(text='hi'))]
+    finally:
+        client.close()
+    client = Client(App(__name__))
+    try:
+        assert client.call_msgpack('/echo/echo', text='hi').status == 415
+    finally:
+        client.close()
+
+
+@concurrency_limit(4, max_queue=8, queue_timeout=1)
+class LimitedService:
+    @concurrency_limit(1)
+    async def do_limited(self) -> T.dict(ok=T.bool):
+        return dict(ok=True)
+
+
+def test_concurrency_limit():
+    app = App(__name__, service_max_concurrency=2)
+    client = Client(app)
+    try:
+        assert client.call('/limited/limited').json == dict(ok=True)
+        info = app.bulkhead_info()
+        assert info['Limited']['max_concurrency'] == 4
+        assert info['Limited.do_limited']['max_concurrency'] == 1
+        assert info['Echo']['max_concurrency'] == 2
+        assert info['Echo']['in_flight'] == 0
+    finally:
+        client.close()
+
+
+class SlowService:
+    async def do_sleep(self, seconds: T.float) -> T.dict(remaining=T.float.optional):
+        remaining = self.context.remaining()
+        await sleep(seconds)
+        return dict(remaining=remaining)
+
+    @max_timeout(0.05)
+    async def do_capped(self, seconds: T.float) -> T.dict(ok=T.bool):
+        await sleep(seconds)
+        return dict(ok=True)
+
+
+def test_request_timeout():
+    app = App(__name__, batch_enable=True)
+    client = Client(app)
+    try:
+        assert client.call('/slow/sleep', seconds=0).json == dict(remaining=None)
+        client.headers['X-Request-Timeout'] = '0.05'
+        remaining = client.call('/slow/sleep', seconds=0).json['remaining']
+        assert 0 < remaining <= 0.05
+        res = client.call('/slow/sleep', seconds=1)
+        assert res.status == 504 and res.error == ServiceTimeout.code
+        # invalid timeouts are ignored
+        for value in ['abc', 'inf', '-inf', 'nan']:
+            client.headers['X-Request-Timeout'] = value
+            assert client.call('/slow/sleep', seconds=0).json == dict(remaining=None)
+        del client.headers['X-Request-Timeout']
+        assert client.call('/slow/capped', seconds=0).json == dict(ok=True)
+        assert client.call('/slow/capped', seconds=1).error == ServiceTimeout.code
+        calls = [dict(method='slow/capped', params=dict(seconds=1))]
+        res = client.request('/batch', method='POST', body=json.dumps(calls),
+                             headers={'Content-Type': 'application/json'})
+        assert res.json[0]['error'] == ServiceTimeout.code
+    finally:
+        client.close()
+
+
+class OffloadService:
+    @offload('thread')
+    def do_hash(self, text: T.str) -> T.dict(digest=T.str):
+        if text == 'error':
+            raise ServiceInvalidParams('invalid text')
+        return dict(digest=hashlib.sha256(text.encode()).hexdigest())
+
+    @offload('process')
+    def do_pid(self) -> T.dict(pid=T.int):
+        return dict(pid=os.getpid())
+
+
+def test_offload():
+    app = App(__name__)
+    client = Client(app)
+    try:
+        digest = hashlib.sha256(b'hi').hexdigest()
+        assert client.call('/offload/hash', text='hi').json == dict(digest=digest)
+        res = client.call('/offload/hash', text='error')
+        assert res.error == ServiceInvalidParams.code
+        assert client.call('/offload/pid').json['pid'] != os.getpid()
+        info = app.offload_info()
+        assert info['thread']['executions'] == 2 and info['thread']['errors'] == 1
+        assert info['process']['executions'] == 1
+        assert info['thread']['in_flight'] == 0 and info['thread']['queued'] == 0
+    finally:
+        client.close()
+
+
+class ExportService:
+    produced = 0
+
+    async def do_rows(
+        self, n: T.int.min(0), fail: T.bool.default(False),
+    ) -> T.dict(i=T.int):
+        """Items are streamed as NDJSON, the returns schema is of each item"""
+        for i in range(n):
+            ExportService.produced = i + 1
+            yield dict(i=i)
+        if fail:
+            raise ServiceInvalidParams('export failed')
+
+
+def test_stream():
+    app = App(__name__, stream_flush_items=2, batch_enable=True)
+    client = Client(app)
+    try:
+        res = client.call('/export/rows', n=5)
+        assert res.is_ndjson and res.headers['Transfer-Encoding'] == 'chunked'
+        stream = res.stream
+        # lines are read while the method is still producing
+        assert next(stream) == dict(i=0) and ExportService.produced < 5
+        assert list(stream) == [dict(i=i) for i in range(1, 5)]
+        assert ExportService.produced == 5
+        res = client.call('/export/rows', n=5)
+        assert res.content.count(b'\n') == 5 and len(list(res.stream)) == 5
+        # unfinished streams are closed with the client
+        assert next(client.call('/export/rows', n=5).stream) == dict(i=0)
+        assert list(client.call('/export/rows', n=0).stream) == []
+        items = list(client.call('/export/rows', n=2, fail=True).stream)
+        assert items[:2] == [dict(i=0), dict(i=1)]
+        assert items[2]['error'] == ServiceInvalidParams.code
+        assert client.call('/export/rows', n=-1).error == ServiceInvalidParams.code
+        calls = [dict(method='export/rows', params=dict(n=1))]
+        res = client.request('/batch', method='POST', body=json.dumps(calls),
+                             headers={'Content-Type': 'application/json'})
+        assert res.json[0]['error'] == 400
+    finally:
+        client.close()
+
+
+class ListService:
+    async def do_items(self, n: T.int) -> T.list(T.dict(i=T.int, s=T.str)):
+        return [dict(i=i, s='中') for i in range(n)]
+
+
+@pytest.mark.parametrize('config', [
+    dict(json_incremental_min_items=3),
+    dict(json_incremental_min_items=0, json_incremental_min_size=100),
+    dict(json_incremental_min_items=3, json_backend='orjson'),
+])
+def test_incremental_json(config):
+    if config.get('json_backend') == 'orjson':
+        pytest.importorskip('orjson')
+    app = App(__name__, response_flush_threshold=50, **config)
+    client = Client(app)
+    try:
+        expect = [dict(i=i, s='中') for i in range(200)]
+        res = client.call('/list/items', n=200)
+        assert res.headers['Transfer-Encoding'] == 'chunked'
+        assert 'Content-Length' not in res.headers
+        assert res.json == expect
+        res = client.call('/list/items', n=2)
+        assert res.headers['Content-Length'] and res.json == expect[:2]
+    finally:
+        client.close()
+
+
+class CountService:
+    calls = 0
+
+    @cached(ttl=60, maxsize=2)
+    async def do_count(self, n: T.int.default(1)) -> T.dict(n=T.int, calls=T.int):
+        CountService.calls += 1
+        return dict(n=n, calls=CountService.calls)
+
+
+def test_cached():
+    app = App(__name__, batch_enable=True)
+    client = Client(app)
+    cache = get_cache(CountService.do_count)
+    cache.clear()
+    try:
+        assert client.call('/count/count').json == dict(n=1, calls=1)
+        assert client.call('/count/count', n=1).json == dict(n=1, calls=1)
+        assert client.call('/count/count', n=2).json == dict(n=2, calls=2)
+        assert cache.invalidate()
+        assert client.call('/count/count').json == dict(n=1, calls=3)
+        client.call('/count/count', n=3)
+        info = cache.info()
+        assert info['hits'] == 1 and info['misses'] == 4
+        assert info['invalidations'] == 1 and info['evictions'] == 1
+        # batch entries share the cache with direct calls
+        calls = json.dumps([dict(method='count/count', params=dict(n=3))])
+        headers = {'Content-Type': 'application/json'}
+        for __ in range(2):
+            res = client.request('/batch', method='POST', body=calls, headers=headers)
+            assert res.json == [dict(result=dict(n=3, calls=5))]
+    finally:
+        client.close()
+
+
+class ReturnsService:
+    @validate_returns('sample', sample_rate=1)
+    async def do_sample(self) -> T.dict(n=T.int):
+        return dict(n='x')
+
+    @validate_returns('never')
+    async def do_never(self) -> T.dict(n=T.int):
+        return dict(n='x')
+
+    async def do_always(self) -> T.dict(n=T.int):
+        return dict(n='x')
+
+
+def test_returns_validation():
+    app = App(__name__)
+    client = Client(app)
+    try:
+        assert client.call('/returns/sample').json == dict(n='x')
+        assert client.call('/returns/never').json == dict(n='x')
+        assert client.call('/returns/always').status == 500
+        handlers = {h.name: h for s in app.services for h in s.handlers}
+        assert handlers['do_sample'].returns_metrics['invalid'] == 1
+        assert handlers['do_never'].returns_metrics['skipped'] == 1
+    finally:
+        client.close()
+
+
+class FileService:
+    @route.get('/file')
+    async def get_file(self):
+        path = self.request.query['path']
+        self.response.body = FileBody(path, offset=2, count=5)
+
+
+def test_file_response(tmp_path):
+    path = tmp_path / 'hello.txt'
+    path.write_bytes(b'hello world')
+    app = App(__name__)
+    client = Client(app)
+    try:
+        res = client.get('/file', query={'path': str(path)})
+        assert res.content == b'llo w'
+        assert res.headers['Content-Length'] == '5'
+    finally:
+        client.close()